@@ -0,0 +1,285 @@
+# Python Imports
+import os
+import sys
+import time
+import argparse
+import threading
+import configparser
+import datetime
+
+# LightPlanStudio Imports
+# Only the Qt-free modules may be imported here so the CLI starts fast and
+# runs on machines without PySide6
+from LightPlanCore import LogLevel, SchedulerMode, LightPlanPlayer, CompiledSchedule, RatePolicy, RateLimiter, read_lightplan
+
+def msToStr(ms):
+    mins, secs = divmod(ms/1000.0, 60)
+    return "{:02d}:{:06.3f}".format(int(mins), secs)
+
+def strToMs(offset_str):
+    try:
+        split = offset_str.split(":")
+        if(len(split) == 1):
+            return int(float(split[0]) * 1000)
+        mins = int(split[0])
+        secs = float(split[1])
+    except Exception as e:
+        raise argparse.ArgumentTypeError(f"Invalid song position: {offset_str}")
+    return (mins * 60 * 1000) + int(secs * 1000)
+
+def strToAccount(account_str):
+    # user:token@channel
+    try:
+        credentials, channel = account_str.rsplit("@", 1)
+        user, token = credentials.split(":", 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid account, expected user:token@channel: {account_str}")
+    return (user, token.replace("oauth:", ""), channel)
+
+def strToLatency(latency_str):
+    # profile=ms
+    name, _, ms = latency_str.partition("=")
+    try:
+        return (name.strip(), int(ms))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid latency, expected profile=ms: {latency_str}")
+
+def strToSink(sink_str):
+    # name=url
+    name, _, url = sink_str.partition("=")
+    if(not name or not url):
+        raise argparse.ArgumentTypeError(f"Invalid sink, expected name=url: {sink_str}")
+    return (name.strip(), url.strip())
+
+def valueToBool(value):
+    return value.lower() == 'true' if isinstance(value, str) else bool(value)
+
+def read_twitch_settings(ini_path):
+    # LightPlanStudio.ini is written by QSettings, which configparser can read
+    config = configparser.ConfigParser(interpolation=None)
+    config.optionxform = str
+    settings = {}
+    if(ini_path and os.path.exists(ini_path)):
+        config.read(ini_path)
+        if(config.has_section("Twitch")):
+            settings["user"] = config.get("Twitch", "Username", fallback="")
+            settings["token"] = config.get("Twitch", "OAuthToken", fallback="")
+            settings["channel"] = config.get("Twitch", "Channel", fallback="")
+    return settings
+
+def default_ini_path():
+    if(sys.platform == "win32"):
+        config_dir = os.path.join(os.environ.get("LOCALAPPDATA", os.path.expanduser("~")), "ChillAspect", "LightPlanStudio")
+    elif(sys.platform == "darwin"):
+        config_dir = os.path.join(os.path.expanduser("~"), "Library", "Preferences")
+    else:
+        config_dir = os.environ.get("XDG_CONFIG_HOME", os.path.join(os.path.expanduser("~"), ".config"))
+    return os.path.join(config_dir, "LightPlanStudio.ini")
+
+
+class LightPlanCLI():
+
+    def __init__(self, args):
+        self.args = args
+        self.log_level = LogLevel.DEBUG if args.verbose else LogLevel.ERROR
+        self.chat = None
+        self.player = None
+        self.connected = threading.Event()
+        self.failed = threading.Event()
+
+    def log(self, msg, level=LogLevel.INFO):
+        if(not msg or level.value > self.log_level.value):
+            return
+        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+        stream = sys.stderr if level == LogLevel.ERROR else sys.stdout
+        print(f"{timestamp} - {msg}", file=stream, flush=True)
+
+    def connect(self):
+        # Imported here so a --dry-run never opens a socket
+        from LightPlanIRC import TwitchChat, TwitchPool
+        settings = read_twitch_settings(self.args.ini)
+        user = self.args.user or settings.get("user", "")
+        token = self.args.token or settings.get("token", "")
+        channel = self.args.channel or settings.get("channel", "")
+        if(not user or not token or not channel):
+            self.log("Twitch user, token and channel are required (use --ini or --user/--token/--channel)", LogLevel.ERROR)
+            return False
+        port = self.args.port if self.args.port is not None else (6697 if self.args.tls else 6667)
+        if(self.args.account):
+            # Extra accounts turn the connection into a pool
+            accounts = [(user, token.replace("oauth:", ""), channel)] + self.args.account
+            self.chat = TwitchPool(accounts, self.args.server, port, use_tls=self.args.tls, stale_ms=self.args.stale_ms,
+                mode=self.args.pool_mode, rate_limit=self.args.rate_limit or 20, rate_window_ms=self.args.rate_window * 1000,
+                probe=not self.args.no_probe)
+        else:
+            self.chat = TwitchChat(user, token.replace("oauth:", ""), channel, self.args.server, port,
+                use_tls=self.args.tls, stale_ms=self.args.stale_ms, probe=not self.args.no_probe)
+        self.chat.signals.log.connect(self.log)
+        self.chat.signals.irc_connect.connect(self.connected.set)
+        self.chat.signals.connect_failed.connect(self.failed.set)
+        self.chat.signals.irc_disconnect.connect(self.failed.set)
+        thread = threading.Thread(target=self.chat.run, name="TwitchChat", daemon=True)
+        thread.start()
+        deadline = time.monotonic() + self.args.connect_timeout
+        while time.monotonic() < deadline:
+            if(self.connected.wait(0.1)):
+                return True
+            if(self.failed.is_set()):
+                break
+        self.log("Could not connect to Twitch IRC", LogLevel.ERROR)
+        self.chat.die()
+        return False
+
+    def rate_limit_connections(self):
+        # --rate-limit is per account, a pool can send more (its members each
+        # keep to their own share)
+        if(not self.args.account):
+            return 1
+        from LightPlanIRC import pool_rate_multiplier
+        channel = self.args.channel or read_twitch_settings(self.args.ini).get("channel", "")
+        return pool_rate_multiplier([channel] + [account[2] for account in self.args.account], self.args.pool_mode)
+
+    def print_cue(self, msg, index):
+        self.log(f"[dry run] {msg}")
+
+    def run(self):
+        try:
+            lightplan = read_lightplan(self.args.plan)
+        except (OSError, ValueError) as err:
+            self.log(f"Could not load LightPlan: {err}", LogLevel.ERROR)
+            return 1
+        artist = lightplan.get("song_artist", "")
+        title = lightplan.get("song_title", "")
+        self.log(f"LightPlan: {artist} - {title} ({len(lightplan['events'])} events)")
+
+        # Events naming a sink that isnt given with --sink go to chat, and are
+        # rate limited and checked as chat messages
+        schedule = CompiledSchedule.compile(lightplan, self.args.delay, latencies=dict(self.args.latency or []), sinks=dict(self.args.sink or []))
+        for name in schedule.unknown_sinks:
+            self.log(f"Output sink '{name}' isnt configured, its events go to Twitch chat", LogLevel.ERROR)
+        rate_limiter = None
+        if(self.args.rate_limit > 0):
+            # Warn before the show about cues Twitch would throttle
+            rate_limiter = RateLimiter(self.args.rate_limit * self.rate_limit_connections(), self.args.rate_window * 1000, RatePolicy.get(self.args.rate_policy))
+            report = rate_limiter.check(schedule, self.args.adjust)
+            self.log(report.summary())
+            for line in report.details():
+                self.log(line)
+
+        outbound = None
+        router = None
+        if(not self.args.dry_run):
+            if(not self.connect()):
+                return 1
+            outbound = self.chat.outbound
+            self.chat.prepare(schedule)
+            if(self.args.sink):
+                # Imported here for the same reason as TwitchChat
+                from LightPlanSinks import SinkSignals, SinkRouter, create_sinks
+                sink_signals = SinkSignals()
+                sink_signals.log.connect(self.log)
+                try:
+                    sinks = create_sinks(dict(self.args.sink), sink_signals, self.args.stale_ms)
+                except ValueError as err:
+                    self.log(str(err), LogLevel.ERROR)
+                    self.chat.die()
+                    return 1
+                router = SinkRouter(outbound, sinks, sink_signals)
+                router.prepare(schedule)
+                outbound = router
+
+        chat_latency = self.chat.chat_latency if self.chat is not None else None
+        self.player = LightPlanPlayer(lightplan, self.args.delay, self.args.adjust, chat_latency=chat_latency, compensate_chat=self.args.compensate_chat,
+            scheduler_mode=SchedulerMode.get(self.args.scheduler), outbound=outbound, seek_ms=self.args.start_at,
+            schedule=schedule, rate_limiter=rate_limiter)
+        self.player.signals.log.connect(self.log)
+        self.player.signals.privmsg.connect(self.print_cue)
+        self.player.signals.progress.connect(self.progress)
+
+        if(not self.args.no_wait):
+            start_str = msToStr(self.args.start_at if self.args.start_at is not None else lightplan["starting_ms"])
+            input(f"Press Enter at song position {start_str} to start the LightPlan...")
+        try:
+            self.player.run()
+        except KeyboardInterrupt:
+            self.player.stop()
+            self.player.done("LightPlan Stopped")
+
+        # Give the IRC thread a moment to write the last cue
+        if(self.chat is not None):
+            time.sleep(0.1)
+        self.print_summary()
+        if(self.args.report):
+            timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            json_path, csv_path = self.player.telemetry.write_report(self.args.report, f"{timestamp} {artist} - {title}", {
+                "song_artist": artist,
+                "song_title": title,
+                "started": timestamp,
+                "stream_delay_ms": self.args.delay,
+                "runtime_adjust_ms": self.args.adjust,
+                "scheduler": type(self.player.scheduler).__name__,
+                "cpu_ms": self.player.stats.cpu_ms(),
+                "cpu_percent": self.player.stats.cpu_percent()
+            })
+            self.log(f"Timing Report: {json_path}")
+        if(router is not None):
+            router.close()
+        if(self.chat is not None):
+            for line in self.chat.summary_lines():
+                self.log(line)
+            self.chat.die()
+        return 0
+
+    def progress(self, cur_evt_num, next_event_secs, next_command, orig_index):
+        self.log(f"Event {cur_evt_num}/{len(self.player.schedule)} next: {next_command} at {next_event_secs}s", LogLevel.DEBUG)
+
+    def print_summary(self):
+        summary = self.player.telemetry.summary()
+        if(summary["fired"] > 0):
+            err = summary["error_ms"]
+            self.log(f"Firing error p50 {err['p50']:+.2f}ms p90 {err['p90']:+.2f}ms p99 {err['p99']:+.2f}ms max {err['max']:+.2f}ms")
+        if(summary["sent"] > 0):
+            lat = summary["send_latency_ms"]
+            self.log(f"Send latency p50 {lat['p50']:.2f}ms p90 {lat['p90']:.2f}ms p99 {lat['p99']:.2f}ms max {lat['max']:.2f}ms")
+        if(summary["queue_latency_ms"]["count"] > 0):
+            lat = summary["queue_latency_ms"]
+            self.log(f"Queue to write p50 {lat['p50']:.3f}ms p90 {lat['p90']:.3f}ms p99 {lat['p99']:.3f}ms max {lat['max']:.3f}ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a LightPlan without the LightPlanStudio GUI")
+    parser.add_argument("plan", help="Path to a .plan file")
+    parser.add_argument("--ini", default=default_ini_path(), help="LightPlanStudio.ini to read Twitch settings from")
+    parser.add_argument("--user", help="Twitch user name")
+    parser.add_argument("--token", help="Twitch OAuth token")
+    parser.add_argument("--channel", help="Twitch channel to send to")
+    parser.add_argument("--server", default="irc.chat.twitch.tv")
+    parser.add_argument("--port", type=int, default=None, help="IRC port (default 6667, or 6697 with --tls)")
+    parser.add_argument("--account", type=strToAccount, action="append", help="Extra user:token@channel to send through (repeatable)")
+    parser.add_argument("--pool-mode", default="channel", choices=["channel", "round-robin"],
+        help="With --account: send each cue once per channel, or once in total rotating between accounts")
+    parser.add_argument("--sink", type=strToSink, action="append",
+        help="Output sink name=url (udp://, osc://host:port/address or http://) for events or plans naming it (repeatable)")
+    parser.add_argument("--latency", type=strToLatency, action="append",
+        help="Measured latency for a latency profile, profile=ms (repeatable)")
+    parser.add_argument("--no-probe", action="store_true", help="Dont measure the chat path with a second, read only connection")
+    parser.add_argument("--compensate-chat", action="store_true", help="Fire cues early by the measured chat uplink")
+    parser.add_argument("--tls", action="store_true", help="Connect to Twitch over TLS")
+    parser.add_argument("--stale-ms", type=int, default=2000, help="Drop cues older than this when the connection comes back")
+    parser.add_argument("--connect-timeout", type=float, default=15)
+    parser.add_argument("--delay", type=int, default=0, help="Stream delay in ms")
+    parser.add_argument("--adjust", type=int, default=0, help="Runtime adjustment in ms")
+    parser.add_argument("--start-at", type=strToMs, default=None, help="Start at this song position (mm:ss.zzz)")
+    parser.add_argument("--scheduler", default=SchedulerMode.DEADLINE.name.lower(), choices=[mode.name.lower() for mode in SchedulerMode])
+    parser.add_argument("--rate-limit", type=int, default=20, help="Twitch messages allowed per rate window (0 disables the check)")
+    parser.add_argument("--rate-window", type=float, default=30, help="Twitch rate window in seconds")
+    parser.add_argument("--rate-policy", default=RatePolicy.NONE.name.lower(), choices=[policy.name.lower() for policy in RatePolicy],
+        help="What to do with cues over the rate limit")
+    parser.add_argument("--no-wait", action="store_true", help="Start immediately instead of waiting for Enter")
+    parser.add_argument("--dry-run", action="store_true", help="Print cues instead of sending them to Twitch")
+    parser.add_argument("--report", help="Write JSON/CSV timing reports to this directory")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    sys.exit(LightPlanCLI(parse_args()).run())
@@ -0,0 +1,1041 @@
+#Python Imports
+import os
+import csv
+import sys
+import json
+import math
+import time
+import threading
+from array import array
+from bisect import bisect_left
+from collections import deque
+from enum import Enum, auto
+
+# Qt-free LightPlan runtime pieces. Nothing in here may import PySide6 so it
+# stays usable from worker threads and tools that dont start a Qt app.
+
+#Log Levels
+class LogLevel(Enum):
+    INFO = 0
+    ERROR = 10
+    DEBUG = 20
+    
+    @staticmethod
+    def get(value):
+        for level in LogLevel:
+            if(value == level.value):
+                return level
+        return LogLevel.INFO
+
+class SchedulerMode(Enum):
+    POLL = auto()
+    DEADLINE = auto()
+
+    @staticmethod
+    def get(value):
+        if isinstance(value, SchedulerMode):
+            return value
+        for mode in SchedulerMode:
+            if(str(value).strip().upper() == mode.name):
+                return mode
+        return SchedulerMode.DEADLINE
+
+
+class PollScheduler():
+    # The original behaviour: wake every 0.1 ms and compare against the clock
+
+    def __init__(self, interval_s=0.0001, clock=time.perf_counter):
+        self.interval_s = interval_s
+        self.clock = clock
+
+    def now(self):
+        return self.clock()
+
+    def wait(self, deadline):
+        if(self.clock() >= deadline):
+            return True
+        time.sleep(self.interval_s)
+        return self.clock() >= deadline
+
+
+class DeadlineScheduler():
+    # Sleeps until just before the deadline and only spins for the last
+    # spin_ms. wait() returns False after at most max_sleep_ms so the caller
+    # can notice a stop request or a changed runtime adjustment and re-arm.
+
+    def __init__(self, spin_ms=2.0, max_sleep_ms=20.0, max_spin_ms=20.0, clock=time.perf_counter):
+        self.spin_s = spin_ms / 1000
+        self.max_sleep_s = max_sleep_ms / 1000
+        self.max_spin_s = max_spin_ms / 1000
+        self.clock = clock
+
+    def now(self):
+        return self.clock()
+
+    def wait(self, deadline):
+        now = self.clock()
+        remaining = deadline - now
+        if(remaining <= 0):
+            return True
+        if(remaining > self.spin_s):
+            request = min(remaining - self.spin_s, self.max_sleep_s)
+            time.sleep(request)
+            # Widen the spin window if the OS timer oversleeps (Windows)
+            oversleep = (self.clock() - now) - request
+            if(oversleep > self.spin_s):
+                self.spin_s = min(oversleep * 1.25, self.max_spin_s)
+            return self.clock() >= deadline
+        while self.clock() < deadline:
+            time.sleep(0)
+        return True
+
+
+def create_scheduler(mode):
+    if(SchedulerMode.get(mode) == SchedulerMode.POLL):
+        return PollScheduler()
+    return DeadlineScheduler()
+
+
+class RunStats():
+    # Firing error and CPU use of the thread executing a LightPlan
+
+    def __init__(self):
+        self.count = 0
+        self.total_error_ms = 0.0
+        self.total_abs_error_ms = 0.0
+        self.max_abs_error_ms = 0.0
+        self.wall_start = 0.0
+        self.wall_end = 0.0
+        self.cpu_start = 0.0
+        self.cpu_end = 0.0
+
+    def start(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+
+    def stop(self):
+        self.wall_end = time.perf_counter()
+        self.cpu_end = time.thread_time()
+
+    def record(self, error_ms):
+        self.count += 1
+        self.total_error_ms += error_ms
+        abs_error = abs(error_ms)
+        self.total_abs_error_ms += abs_error
+        if(abs_error > self.max_abs_error_ms):
+            self.max_abs_error_ms = abs_error
+
+    def cpu_ms(self):
+        return (self.cpu_end - self.cpu_start) * 1000
+
+    def wall_ms(self):
+        return (self.wall_end - self.wall_start) * 1000
+
+    def cpu_percent(self):
+        wall = self.wall_ms()
+        if(wall <= 0):
+            return 0.0
+        return self.cpu_ms() / wall * 100
+
+    def summary(self):
+        if(self.count == 0):
+            return f"Timing: no events fired, CPU {self.cpu_ms():.0f}ms ({self.cpu_percent():.1f}% of one core)"
+        mean_error = self.total_error_ms / self.count
+        mean_abs_error = self.total_abs_error_ms / self.count
+        return (f"Timing: {self.count} events, error mean {mean_error:+.2f}ms, "
+            f"mean abs {mean_abs_error:.2f}ms, max abs {self.max_abs_error_ms:.2f}ms, "
+            f"CPU {self.cpu_ms():.0f}ms ({self.cpu_percent():.1f}% of one core)")
+
+
+def format_error(error_ms):
+    rounded = round(error_ms)
+    if(rounded < 0):
+        return f" {rounded}ms"
+    if(rounded > 0):
+        return f" +{rounded}ms"
+    return ""
+
+
+class CompiledSchedule():
+    # Immutable, array backed form of a LightPlan. Offsets are already
+    # corrected for starting_ms and the stream delay and sorted, so running
+    # the plan is just walking the arrays with a ScheduleCursor. Events can
+    # name an output sink (or inherit the plan's); sink_indexes points into
+    # sinks, -1 meaning the default output. unknown_sinks are the names the
+    # plan uses that werent configured, their events were compiled to -1.
+
+    def __init__(self, offsets, command_indexes, original_indexes, commands, sink_indexes=None, sinks=(), unknown_sinks=()):
+        self._offsets = array("q", offsets)
+        self._command_indexes = array("l", command_indexes)
+        self._original_indexes = array("l", original_indexes)
+        if(sink_indexes is None):
+            sink_indexes = [-1] * len(self._offsets)
+        self._sink_indexes = array("l", sink_indexes)
+        self.offsets = memoryview(self._offsets).toreadonly()
+        self.command_indexes = memoryview(self._command_indexes).toreadonly()
+        self.original_indexes = memoryview(self._original_indexes).toreadonly()
+        self.sink_indexes = memoryview(self._sink_indexes).toreadonly()
+        self.commands = tuple(commands)
+        self.sinks = tuple(sinks)
+        self.unknown_sinks = tuple(unknown_sinks)
+        # For each event the index of the next event that goes to chat (-1
+        # if none), so rate limit look-ahead skips cues for other sinks
+        next_chat = array("l", [-1]) * len(self._offsets)
+        following = -1
+        for index in range(len(self._offsets) - 1, -1, -1):
+            next_chat[index] = following
+            if(self.uses_chat(index)):
+                following = index
+        self._next_chat = next_chat
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def offset(self, index):
+        return self._offsets[index]
+
+    def command(self, index):
+        return self.commands[self._command_indexes[index]]
+
+    def original_index(self, index):
+        return self._original_indexes[index]
+
+    def sink_index(self, index):
+        return self._sink_indexes[index]
+
+    def sink(self, index):
+        sink_index = self._sink_indexes[index]
+        return None if sink_index < 0 else self.sinks[sink_index]
+
+    def uses_chat(self, index):
+        # Events without a sink (or the "chat" sink) go to Twitch chat
+        sink_index = self._sink_indexes[index]
+        return sink_index < 0 or self.sinks[sink_index] == "chat"
+
+    def next_chat_index(self, index):
+        return self._next_chat[index]
+
+    def index_at(self, offset_ms):
+        # Index of the first event due at or after offset_ms
+        return bisect_left(self._offsets, offset_ms)
+
+    @staticmethod
+    def latency_profile(lightplan_dict, name, latencies):
+        # (latency_ms, sink) for a named profile. A measured latency wins over
+        # the plan's own value; None for latency means the stream delay
+        definition = lightplan_dict.get("latency_profiles", {}).get(name) or {}
+        latency = latencies.get(name) if latencies else None
+        if(latency is None):
+            latency = definition.get("latency_ms")
+        return (None if latency is None else int(latency), definition.get("sink") or None)
+
+    @staticmethod
+    def compile(lightplan_dict, stream_delay_ms=0, starting_ms=None, latencies=None, sinks=None):
+        # Events are shifted earlier by the latency of the path they take:
+        # their latency profile's if they have one, otherwise the stream
+        # delay. ignore_delay skips the shift altogether.
+        # sinks are the names of the configured output sinks. When given,
+        # events naming any other sink are compiled to the default output,
+        # since that is where SinkRouter sends them, so uses_chat is exact.
+        if(starting_ms is None):
+            starting_ms = lightplan_dict.get("starting_ms", 0)
+        starting_ms = int(starting_ms or 0)
+        stream_delay_ms = int(stream_delay_ms or 0)
+        command_lookup = {}
+        commands = []
+        sink_lookup = {}
+        sink_names = []
+        unknown_sinks = []
+        configured = None if sinks is None else set(sinks)
+        plan_sink = lightplan_dict.get("sink") or None
+        plan_profile = lightplan_dict.get("profile") or None
+        profiles = {}
+        rows = []
+        for original_index, evt in enumerate(lightplan_dict.get("events", [])):
+            # Calculate the true offset factoring in "ignore_delay" and starting_ms
+            offset = int(evt["offset"]) - starting_ms
+            profile = evt.get("profile") or plan_profile
+            latency = None
+            profile_sink = None
+            if(profile is not None):
+                if(profile not in profiles):
+                    profiles[profile] = CompiledSchedule.latency_profile(lightplan_dict, profile, latencies)
+                latency, profile_sink = profiles[profile]
+            if(not evt.get("ignore_delay", False)):
+                offset -= stream_delay_ms if latency is None else latency
+            command = evt["command"]
+            command_index = command_lookup.get(command)
+            if(command_index is None):
+                command_index = len(commands)
+                command_lookup[command] = command_index
+                commands.append(sys.intern(str(command)))
+            sink = evt.get("sink") or profile_sink or plan_sink
+            if(sink is not None and configured is not None and sink not in configured):
+                if(sink != "chat" and sink not in unknown_sinks):
+                    unknown_sinks.append(sink)
+                sink = None
+            sink_index = -1
+            if(sink is not None):
+                sink_index = sink_lookup.get(sink)
+                if(sink_index is None):
+                    sink_index = len(sink_names)
+                    sink_lookup[sink] = sink_index
+                    sink_names.append(sink)
+            rows.append((offset, original_index, command_index, sink_index))
+        # Original order breaks ties so events at the same offset keep their order
+        rows.sort()
+        return CompiledSchedule(
+            [row[0] for row in rows],
+            [row[2] for row in rows],
+            [row[1] for row in rows],
+            commands,
+            [row[3] for row in rows],
+            sink_names,
+            unknown_sinks)
+
+
+class ScheduleCursor():
+    # Walks a CompiledSchedule without allocating
+
+    def __init__(self, schedule, position=0):
+        self.schedule = schedule
+        self.position = position
+
+    def done(self):
+        return self.position >= len(self.schedule)
+
+    def offset(self):
+        return self.schedule.offset(self.position)
+
+    def command(self):
+        return self.schedule.command(self.position)
+
+    def original_index(self):
+        return self.schedule.original_index(self.position)
+
+    def advance(self):
+        self.position += 1
+
+    def seek(self, offset_ms):
+        self.position = self.schedule.index_at(offset_ms)
+
+
+class TimingTelemetry():
+    # Per event timing samples for one run of a CompiledSchedule. The buffers
+    # are allocated up front so recording during the show is a few array
+    # stores. All times are ms since the LightPlan started.
+
+    histogram_edges = [-50, -20, -10, -5, -2, -1, 0, 1, 2, 5, 10, 20, 50]
+    percentiles = [50, 90, 95, 99]
+
+    def __init__(self, schedule, clock=time.perf_counter):
+        size = len(schedule)
+        self.schedule = schedule
+        self.clock = clock
+        self.origin = 0.0
+        self.scheduled_ms = array("d", [math.nan]) * size
+        self.wake_ms = array("d", [math.nan]) * size
+        self.queued_ms = array("d", [math.nan]) * size
+        self.sent_ms = array("d", [math.nan]) * size
+
+    def start(self, origin=None):
+        self.origin = self.clock() if origin is None else origin
+
+    def now_ms(self):
+        return (self.clock() - self.origin) * 1000
+
+    def mark_wake(self, index, scheduled_ms, wake_ms):
+        self.scheduled_ms[index] = scheduled_ms
+        self.wake_ms[index] = wake_ms
+
+    def mark_queued(self, index, queued_ms=None):
+        if(index < 0 or index >= len(self.queued_ms)):
+            return
+        self.queued_ms[index] = self.now_ms() if queued_ms is None else queued_ms
+
+    def mark_sent(self, index, sent_ms=None):
+        if(index < 0 or index >= len(self.sent_ms)):
+            return
+        self.sent_ms[index] = self.now_ms() if sent_ms is None else sent_ms
+
+    def samples(self):
+        for index in range(len(self.scheduled_ms)):
+            scheduled = self.scheduled_ms[index]
+            if(math.isnan(scheduled)):
+                continue
+            wake = self.wake_ms[index]
+            queued = self.queued_ms[index]
+            sent = self.sent_ms[index]
+            yield {
+                "index": index,
+                "original_index": self.schedule.original_index(index),
+                "command": self.schedule.command(index),
+                "scheduled_ms": scheduled,
+                "wake_ms": wake,
+                "queued_ms": None if math.isnan(queued) else queued,
+                "sent_ms": None if math.isnan(sent) else sent,
+                "error_ms": wake - scheduled,
+                "send_latency_ms": None if math.isnan(sent) else sent - wake,
+                "queue_latency_ms": None if math.isnan(sent) or math.isnan(queued) else sent - queued,
+                "total_error_ms": None if math.isnan(sent) else sent - scheduled
+            }
+
+    @staticmethod
+    def describe(values, edges=None):
+        if(len(values) == 0):
+            return {"count": 0}
+        values = sorted(values)
+        count = len(values)
+        result = {
+            "count": count,
+            "min": values[0],
+            "max": values[-1],
+            "mean": sum(values) / count
+        }
+        for pct in TimingTelemetry.percentiles:
+            # Nearest rank percentile
+            rank = max(1, math.ceil(pct / 100 * count))
+            result[f"p{pct}"] = values[rank-1]
+        if(edges is not None):
+            buckets = [0] * (len(edges) + 1)
+            bucket = 0
+            for value in values:
+                while bucket < len(edges) and value >= edges[bucket]:
+                    bucket += 1
+                buckets[bucket] += 1
+            histogram = []
+            for x in range(len(buckets)):
+                low = edges[x-1] if x > 0 else None
+                high = edges[x] if x < len(edges) else None
+                histogram.append({"from_ms": low, "to_ms": high, "count": buckets[x]})
+            result["histogram"] = histogram
+        return result
+
+    def summary(self):
+        samples = list(self.samples())
+        return {
+            "events": len(self.scheduled_ms),
+            "fired": len(samples),
+            "sent": len([x for x in samples if x["sent_ms"] is not None]),
+            "error_ms": self.describe([x["error_ms"] for x in samples], self.histogram_edges),
+            "send_latency_ms": self.describe([x["send_latency_ms"] for x in samples if x["send_latency_ms"] is not None], self.histogram_edges),
+            "queue_latency_ms": self.describe([x["queue_latency_ms"] for x in samples if x["queue_latency_ms"] is not None], self.histogram_edges),
+            "total_error_ms": self.describe([x["total_error_ms"] for x in samples if x["total_error_ms"] is not None], self.histogram_edges)
+        }
+
+    def write_report(self, directory, basename, extra=None):
+        os.makedirs(directory, exist_ok=True)
+        json_path = os.path.join(directory, f"{basename}.json").replace("\\", "/")
+        csv_path = os.path.join(directory, f"{basename}.csv").replace("\\", "/")
+        samples = list(self.samples())
+        report = {}
+        if(extra):
+            report.update(extra)
+        report["summary"] = self.summary()
+        report["samples"] = samples
+        with open(json_path, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+        fields = ["index", "original_index", "command", "scheduled_ms", "wake_ms", "queued_ms", "sent_ms", "error_ms", "send_latency_ms", "queue_latency_ms", "total_error_ms"]
+        with open(csv_path, "w", newline="") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(samples)
+        return json_path, csv_path
+
+
+class CueQueue():
+    # Thread safe hand off of fired cues from the LightPlanRunner straight to
+    # the IRC thread, so a busy GUI thread cant hold a cue back. Each item is
+    # (text, index, telemetry, queued) where queued is the perf_counter time
+    # of the put; the consumer stamps telemetry once written.
+    # A consumer blocked in something other than wait() (a socket selector)
+    # can set a waker that is called on every put. With maxlen set the
+    # queue is bounded and the oldest cue is dropped (and counted) when full,
+    # since a stale light cue is worth less than the newest one.
+
+    def __init__(self, maxlen=None):
+        self._items = deque(maxlen=maxlen)
+        self._ready = threading.Event()
+        self.maxlen = maxlen
+        self.dropped = 0
+        self.waker = None
+
+    def put(self, text, index=-1, telemetry=None):
+        if(self.maxlen is not None and len(self._items) >= self.maxlen):
+            self.dropped += 1
+        if(telemetry is not None):
+            telemetry.mark_queued(index)
+        self._items.append((text, index, telemetry, time.perf_counter()))
+        self._ready.set()
+        if(self.waker is not None):
+            self.waker()
+
+    def get(self):
+        try:
+            return self._items.popleft()
+        except IndexError:
+            return None
+
+    def wait(self, timeout=None):
+        # Returns True if items are waiting, False if the timeout passed
+        if(self._ready.wait(timeout)):
+            self._ready.clear()
+            return True
+        return False
+
+    def clear(self):
+        self._items.clear()
+
+    def interrupt(self):
+        # Wakes a consumer blocked in wait() without queueing anything
+        self._ready.set()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ChatLatency():
+    # Rolling estimate of the chat path, fed by TwitchChat from our own
+    # messages as seen by a second (read only) connection. For each message:
+    #   rtt_ms          local send -> local receive of the echo
+    #   server_delta_ms Twitch tmi-sent-ts minus the local send time, which
+    #                   is the uplink plus the clock offset to Twitch
+    # The uplink is taken as half the median RTT. Estimates are recomputed
+    # on add() so readers on the runner thread only read attributes.
+
+    def __init__(self, window=32):
+        self.rtt = deque(maxlen=window)
+        self.server_delta = deque(maxlen=window)
+        self.count = 0
+        self.rtt_estimate_ms = None
+        self.uplink_estimate_ms = None
+        self.offset_estimate_ms = None
+
+    @staticmethod
+    def median(values):
+        values = sorted(values)
+        middle = len(values) // 2
+        if(len(values) % 2):
+            return values[middle]
+        return (values[middle-1] + values[middle]) / 2
+
+    def add(self, rtt_ms, server_delta_ms=None):
+        self.count += 1
+        self.rtt.append(rtt_ms)
+        self.rtt_estimate_ms = self.median(self.rtt)
+        self.uplink_estimate_ms = self.rtt_estimate_ms / 2
+        if(server_delta_ms is not None):
+            self.server_delta.append(server_delta_ms)
+            self.offset_estimate_ms = self.median(self.server_delta) - self.uplink_estimate_ms
+
+    def uplink_ms(self):
+        return self.uplink_estimate_ms if self.uplink_estimate_ms is not None else 0
+
+    def summary(self):
+        if(self.count == 0):
+            return "Chat path: no echoes measured"
+        result = f"Chat path: {self.count} echoes, RTT {self.rtt_estimate_ms:.1f}ms, uplink ~{self.uplink_estimate_ms:.1f}ms"
+        if(self.offset_estimate_ms is not None):
+            result += f", clock offset to Twitch {self.offset_estimate_ms:+.1f}ms"
+        return result
+
+
+class AudioClock():
+    # Song position for rehearsals, fed from a media player on the GUI thread
+    # with sync() and read from the runner thread with position_ms(). Player
+    # positions arrive coarse and jittery, so between reports the position is
+    # extrapolated at an estimated playback rate and each report only pulls
+    # the estimate part of the way (drift correction). Jumps larger than
+    # jump_ms are treated as seeks.
+
+    def __init__(self, gain=0.25, jump_ms=250, clock=time.perf_counter):
+        self.gain = gain
+        self.jump_ms = jump_ms
+        self.clock = clock
+        self.seeks = 0
+        # (base position ms, base time, rate, playing) swapped as one tuple so
+        # the runner thread never reads a half updated state
+        self._state = (0.0, self.clock(), 1.0, False)
+        self._reference = None
+        self.reports = 0
+        self.max_abs_correction_ms = 0.0
+        self.drift_ms = 0.0
+        self.max_abs_drift_ms = 0.0
+        self.reference_secs = 0.0
+
+    def position_ms(self, now=None):
+        position, base_time, rate, playing = self._state
+        if(not playing):
+            return position
+        if(now is None):
+            now = self.clock()
+        return position + (now - base_time) * 1000 * rate
+
+    def playing(self):
+        return self._state[3]
+
+    def sync(self, reported_ms, playing=True):
+        now = self.clock()
+        position, base_time, rate, was_playing = self._state
+        predicted = self.position_ms(now)
+        correction = reported_ms - predicted
+        if(playing != was_playing or abs(correction) > self.jump_ms):
+            # Play, pause or seek. Start over from the reported position
+            if(abs(correction) > self.jump_ms):
+                self.seeks += 1
+            self._state = (float(reported_ms), now, rate, playing)
+            self._reference = (float(reported_ms), now) if playing else None
+            return
+        if(not playing):
+            return
+        self.reports += 1
+        if(abs(correction) > self.max_abs_correction_ms):
+            self.max_abs_correction_ms = abs(correction)
+        # How far the audio clock has wandered from a free running wall clock
+        ref_position, ref_time = self._reference
+        elapsed_secs = now - ref_time
+        self.drift_ms = reported_ms - (ref_position + elapsed_secs * 1000)
+        self.reference_secs = elapsed_secs
+        if(abs(self.drift_ms) > self.max_abs_drift_ms):
+            self.max_abs_drift_ms = abs(self.drift_ms)
+        if(elapsed_secs >= 2):
+            rate = min(max((reported_ms - ref_position) / (elapsed_secs * 1000), 0.95), 1.05)
+        self._state = (predicted + correction * self.gain, now, rate, True)
+
+    def drift_ppm(self):
+        if(self.reference_secs <= 0):
+            return 0.0
+        return self.drift_ms / (self.reference_secs * 1000) * 1000000
+
+    def summary(self):
+        return (f"Audio clock drift: {self.drift_ms:+.1f}ms over {self.reference_secs:.1f}s "
+            f"({self.drift_ppm():+.0f} ppm), max drift {self.max_abs_drift_ms:.1f}ms, "
+            f"max correction {self.max_abs_correction_ms:.1f}ms over {self.reports} position reports")
+
+
+class PreparedLightPlan():
+    # A .plan file parsed and compiled ahead of time, e.g. the next song of a
+    # setlist while the current one is still running
+
+    def __init__(self, path, lightplan_dict, stream_delay_ms=0, latencies=None, sinks=None):
+        self.path = path
+        self.lightplan = lightplan_dict
+        self.stream_delay_ms = stream_delay_ms
+        self.latencies = dict(latencies) if latencies else {}
+        self.sinks = None if sinks is None else frozenset(sinks)
+        self.schedule = CompiledSchedule.compile(lightplan_dict, stream_delay_ms, latencies=self.latencies, sinks=self.sinks)
+
+    def schedule_for(self, stream_delay_ms, latencies=None, sinks=None):
+        # The stream delay, measured latencies and output sinks can change
+        # between preloading and starting
+        latencies = dict(latencies) if latencies else {}
+        sinks = None if sinks is None else frozenset(sinks)
+        if(stream_delay_ms != self.stream_delay_ms or latencies != self.latencies or sinks != self.sinks):
+            self.stream_delay_ms = stream_delay_ms
+            self.latencies = latencies
+            self.sinks = sinks
+            self.schedule = CompiledSchedule.compile(self.lightplan, stream_delay_ms, latencies=latencies, sinks=sinks)
+        return self.schedule
+
+    def name(self):
+        return f"{self.lightplan.get('song_artist', '')} - {self.lightplan.get('song_title', '')}"
+
+    @staticmethod
+    def load(path, stream_delay_ms=0, latencies=None, sinks=None):
+        return PreparedLightPlan(path, read_lightplan(path), stream_delay_ms, latencies, sinks)
+
+
+PARALLEL_PARSE_MIN = 64
+
+def read_lightplan(path):
+    with open(path, "r") as file:
+        lightplan_dict = json.load(file)
+    if(not isinstance(lightplan_dict, dict) or "events" not in lightplan_dict
+            or "song_artist" not in lightplan_dict or "song_title" not in lightplan_dict):
+        raise ValueError(f"Not a LightPlan: {path}")
+    lightplan_dict.setdefault("starting_ms", 0)
+    return lightplan_dict
+
+def parse_lightplan(path):
+    # Never raises so it can run in a process pool: (path, dict, None) or
+    # (path, None, error)
+    try:
+        return (path, read_lightplan(path), None)
+    except (OSError, ValueError) as err:
+        return (path, None, str(err))
+
+def parse_lightplans(paths, workers=None):
+    # JSON parsing holds the GIL, so big imports are spread over processes.
+    # A handful of files isnt worth the cost of starting the pool.
+    paths = list(paths)
+    if(len(paths) < PARALLEL_PARSE_MIN):
+        return [parse_lightplan(path) for path in paths]
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or min(os.cpu_count() or 1, 8)
+    chunksize = max(1, len(paths) // (workers * 4))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(parse_lightplan, paths, chunksize=chunksize))
+    except (OSError, RuntimeError):
+        # No process pool here (e.g. a restricted sandbox), parse in place
+        return [parse_lightplan(path) for path in paths]
+
+
+class RatePolicy(Enum):
+    NONE = auto()
+    DROP = auto()
+    SHIFT = auto()
+    COALESCE = auto()
+
+    @staticmethod
+    def get(value):
+        if isinstance(value, RatePolicy):
+            return value
+        for policy in RatePolicy:
+            if(str(value).strip().upper() == policy.name):
+                return policy
+        return RatePolicy.NONE
+
+
+class RateLimiter():
+    # Token bucket model of the Twitch chat limit: capacity messages, refilled
+    # continuously over window_ms. Times are ms on the LightPlan clock.
+    #   NONE     send everything (Twitch drops what is over the limit)
+    #   DROP     skip cues that have no token
+    #   SHIFT    hold cues until a token is available
+    #   COALESCE like SHIFT, but a held cue is skipped when the next cue is
+    #            due before it could be sent (the later light state wins)
+
+    SEND = "send"
+    DROP = "drop"
+
+    def __init__(self, capacity=20, window_ms=30000, policy=RatePolicy.NONE):
+        self.capacity = max(int(capacity), 1)
+        self.window_ms = window_ms
+        self.policy = RatePolicy.get(policy)
+        self.reset()
+
+    def reset(self):
+        self.tokens = float(self.capacity)
+        self.last_ms = None
+
+    def _tokens_at(self, t_ms):
+        if(self.last_ms is None):
+            return self.tokens
+        elapsed = max(t_ms - self.last_ms, 0)
+        return min(self.capacity, self.tokens + elapsed * self.capacity / self.window_ms)
+
+    def available_at(self, t_ms):
+        tokens = self._tokens_at(t_ms)
+        if(tokens >= 1):
+            return t_ms
+        return t_ms + (1 - tokens) * self.window_ms / self.capacity
+
+    def take(self, t_ms):
+        self.tokens = self._tokens_at(t_ms) - 1
+        self.last_ms = t_ms if self.last_ms is None else max(t_ms, self.last_ms)
+
+    def shift(self, delta_ms):
+        # The LightPlan clock was moved (a seek). The last send moves with it
+        # so the bucket keeps refilling in real time
+        if(self.last_ms is not None):
+            self.last_ms += delta_ms
+
+    def decide(self, target_ms, next_target_ms=None, policy=None):
+        # Returns (SEND, send_at_ms) or (DROP, target_ms). Doesnt take a token
+        policy = self.policy if policy is None else policy
+        if(policy == RatePolicy.NONE):
+            return (self.SEND, target_ms)
+        available = self.available_at(target_ms)
+        if(available <= target_ms):
+            return (self.SEND, target_ms)
+        if(policy == RatePolicy.DROP):
+            return (self.DROP, target_ms)
+        if(policy == RatePolicy.COALESCE and next_target_ms is not None and next_target_ms <= available):
+            return (self.DROP, target_ms)
+        return (self.SEND, available)
+
+    def check(self, schedule, adjust_ms=0):
+        # Linear sweep over the compiled offsets with a fresh bucket. With
+        # policy NONE this reports what Twitch itself would throw away
+        policy = RatePolicy.DROP if self.policy == RatePolicy.NONE else self.policy
+        bucket = RateLimiter(self.capacity, self.window_ms, policy)
+        report = RateReport(schedule, self, policy)
+        offsets = schedule.offsets
+        count = len(offsets)
+        for index in range(count):
+            if(not schedule.uses_chat(index)):
+                continue
+            target = offsets[index] + adjust_ms
+            next_index = schedule.next_chat_index(index)
+            next_target = offsets[next_index] + adjust_ms if next_index >= 0 else None
+            action, send_at = bucket.decide(target, next_target)
+            if(action == self.DROP):
+                report.dropped.append(index)
+                continue
+            bucket.take(send_at)
+            if(send_at > target):
+                report.delayed.append((index, send_at - target))
+        return report
+
+
+class RateReport():
+
+    def __init__(self, schedule, limiter, policy):
+        self.schedule = schedule
+        self.capacity = limiter.capacity
+        self.window_ms = limiter.window_ms
+        self.policy = policy
+        self.dropped = []
+        self.delayed = []
+
+    def ok(self):
+        return len(self.dropped) == 0 and len(self.delayed) == 0
+
+    def max_delay_ms(self):
+        if(len(self.delayed) == 0):
+            return 0
+        return max(delay for index, delay in self.delayed)
+
+    def summary(self):
+        limit = f"{self.capacity} msgs/{self.window_ms/1000:g}s"
+        if(self.ok()):
+            return f"Rate limit check ({limit}): all {len(self.schedule)} events can be delivered on time"
+        return (f"Rate limit check ({limit}, {self.policy.name.lower()}): {len(self.dropped)} of {len(self.schedule)} events dropped, "
+            f"{len(self.delayed)} delayed (max {self.max_delay_ms()/1000:.1f}s)")
+
+    def details(self, limit=10):
+        # One line per problem event in LightPlan order, offsets relative to the start
+        lines = []
+        problems = [(index, None) for index in self.dropped] + self.delayed
+        problems.sort()
+        for index, delay in problems[:limit]:
+            offset = self.schedule.offset(index)
+            mins, secs = divmod(abs(offset)/1000, 60)
+            sign = "-" if offset < 0 else ""
+            when = "{}{:02d}:{:06.3f}".format(sign, int(mins), secs)
+            command = self.schedule.command(index)
+            row = self.schedule.original_index(index) + 1
+            if(delay is None):
+                lines.append(f"Event {row} ({command} at {when}) dropped")
+            else:
+                lines.append(f"Event {row} ({command} at {when}) delayed {delay/1000:.2f}s")
+        if(len(problems) > limit):
+            lines.append(f"...and {len(problems) - limit} more")
+        return lines
+
+
+class Callback():
+    # Stand in for a Qt Signal so the Qt-free classes can report the same way
+    # the QRunnables do (signals.log.emit(...))
+
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def emit(self, *args):
+        for slot in self.slots:
+            slot(*args)
+
+
+class PlayerSignals():
+
+    def __init__(self):
+        self.log = Callback()
+        self.progress = Callback()
+        self.done = Callback()
+        self.privmsg = Callback()
+
+
+class LightPlanPlayer():
+    # Runs a LightPlan on the calling thread. LightPlanRunner wraps this in a
+    # QRunnable for the GUI and LightPlanCLI runs it directly. signals needs
+    # log, progress, done and privmsg members with an emit() method.
+
+    def __init__(self, lightplan_dict, stream_delay=0, adjust=0, starting_index=0, scheduler_mode=SchedulerMode.DEADLINE, outbound=None, seek_ms=None, media_clock=None, signals=None, schedule=None, rate_limiter=None, chat_latency=None, compensate_chat=False):
+        self.signals = signals if signals is not None else PlayerSignals()
+        self.lightplan_dict = lightplan_dict
+        # When an outbound CueQueue is given cues skip the GUI thread and
+        # signals.privmsg is not emitted
+        self.outbound = outbound
+        self.stream_delay_ms = stream_delay
+        self.runtime_adjust_ms = adjust
+        self.running = False
+        self.lp_stopped = False
+        self.start_time = 0
+        self.start_ms = self.lightplan_dict["starting_ms"]
+        # starting_index is a position in the compiled schedule. seek_ms is a
+        # song position (same time base as the event offsets) and wins if set
+        self.cur_index = starting_index
+        self.seek_request_ms = seek_ms
+        # Rehearsals follow an AudioClock instead of wall time since start
+        self.media_clock = media_clock
+        self.media_seeks = -1
+        # Optional RateLimiter applied to cues as they fire
+        self.rate_limiter = rate_limiter
+        if(self.rate_limiter is not None):
+            self.rate_limiter.reset()
+        # Live ChatLatency estimate. With compensate_chat cues are fired early
+        # by the measured uplink so they reach Twitch on time
+        self.chat_latency = chat_latency
+        self.compensate_chat = compensate_chat
+        # A schedule compiled ahead of time (see PreparedLightPlan) skips this step
+        if(schedule is None):
+            schedule = CompiledSchedule.compile(self.lightplan_dict, self.stream_delay_ms, self.start_ms)
+        self.schedule = schedule
+        self.scheduler = create_scheduler(scheduler_mode)
+        self.stats = RunStats()
+        self.telemetry = TimingTelemetry(self.schedule, self.scheduler.clock)
+
+    def update_runtime_adjustment(self, adjust_ms):
+        self.runtime_adjust_ms = adjust_ms
+
+    def seek(self, song_ms):
+        # Picked up by the run loop on its next pass
+        self.seek_request_ms = song_ms
+
+    def stop(self):
+        self.lp_stopped = True
+
+    def is_running(self):
+        return self.running
+
+    def apply_seek(self, cursor, song_ms):
+        # Rebase the clock so "now" is song_ms and skip everything already due
+        elapsed_ms = song_ms - self.start_ms
+        self.rebase(self.scheduler.now() - elapsed_ms/1000)
+        self.telemetry.start(self.start_time)
+        cursor.seek(elapsed_ms - self.runtime_adjust_ms)
+        self.log(f"LightPlan Seek: {song_ms}ms, skipped to event {cursor.position}/{len(self.schedule)}", LogLevel.DEBUG)
+
+    def follow_media_clock(self, cursor):
+        # Rebase the clock on the current song position each pass. When the
+        # player was seeked (or on the first pass) move the cursor as well
+        position_ms = self.media_clock.position_ms()
+        self.rebase(self.scheduler.now() - (position_ms - self.start_ms)/1000)
+        self.telemetry.origin = self.start_time
+        if(self.media_seeks == self.media_clock.seeks):
+            return False
+        self.media_seeks = self.media_clock.seeks
+        cursor.seek(position_ms - self.start_ms - self.runtime_adjust_ms)
+        self.log(f"Rehearsal: following audio from {round(position_ms)}ms, event {cursor.position}/{len(self.schedule)}", LogLevel.DEBUG)
+        return True
+
+    def rebase(self, start_time):
+        # Move the LightPlan clock. The rate limiter counts in LightPlan ms,
+        # so it is shifted by the same amount
+        if(self.rate_limiter is not None):
+            self.rate_limiter.shift((self.start_time - start_time)*1000)
+        self.start_time = start_time
+
+    def run(self):
+        self.stats.start()
+
+        #If no events, dont even bother
+        if(len(self.schedule)==0):
+            self.done("No Events To Process")
+            return
+
+        # Initialize some variables
+        cursor = ScheduleCursor(self.schedule, min(max(self.cur_index, 0), len(self.schedule)))
+        self.start_time = self.scheduler.now()
+        self.telemetry.start(self.start_time)
+        self.running = True
+        self.log("LightPlan Started")
+        fired_index = -1
+
+        # Begin LightPlanPlayer Loop
+        while self.running == True:
+            # Check to see if LP has been stopped
+            if(self.lp_stopped):
+                self.done("LightPlan Stopped")
+                return
+
+            # Seek requested (also used to start part way through the song)
+            if(self.seek_request_ms is not None):
+                seek_ms = self.seek_request_ms
+                self.seek_request_ms = None
+                self.apply_seek(cursor, seek_ms)
+                fired_index = -1
+
+            if(self.media_clock is not None and self.follow_media_clock(cursor)):
+                fired_index = -1
+
+            if(cursor.done()):
+                # No more events. Done
+                self.done("LightPlan Complete")
+                return
+
+            # Send the progress update to GUI Thread once per event
+            if(fired_index is not None):
+                self.progress(cursor.position, round(cursor.offset()/1000,1), cursor.command(), fired_index)
+                fired_index = None
+
+            # Only cues that go through chat are fired early for its uplink
+            target_ms = cursor.offset()+self.runtime_adjust_ms
+            if(self.schedule.uses_chat(cursor.position)):
+                target_ms -= self.chat_lead_ms()
+            send_ms = target_ms
+            if(self.rate_limiter is not None and self.schedule.uses_chat(cursor.position)):
+                action, send_ms = self.rate_limiter.decide(target_ms, self.next_target_ms(cursor))
+                if(action == RateLimiter.DROP):
+                    self.log(f"Skipped: {cursor.command()} (rate limit)")
+                    fired_index = cursor.original_index()
+                    cursor.advance()
+                    continue
+
+            # Sleep until the event is due. The scheduler hands control back
+            # early every few ms so stop, seek and runtime adjustments are honored
+            deadline = self.start_time + send_ms/1000
+            if(not self.scheduler.wait(deadline)):
+                continue
+
+            #Calculate the error (number of ms off target)
+            wake_ms = (self.scheduler.now()-self.start_time)*1000
+            error = wake_ms - target_ms
+            self.stats.record(error)
+            self.telemetry.mark_wake(cursor.position, target_ms, wake_ms)
+            if(self.rate_limiter is not None and self.schedule.uses_chat(cursor.position)):
+                self.rate_limiter.take(wake_ms)
+
+            #Fire the event
+            self.fire(cursor.command(), format_error(error), cursor.position)
+            fired_index = cursor.original_index()
+            cursor.advance()
+
+    def chat_lead_ms(self):
+        if(not self.compensate_chat or self.chat_latency is None):
+            return 0
+        return self.chat_latency.uplink_ms()
+
+    def next_target_ms(self, cursor):
+        # Target of the next chat cue, the one a coalesced cue would be
+        # merged into
+        next_position = self.schedule.next_chat_index(cursor.position)
+        if(next_position < 0):
+            return None
+        return self.schedule.offset(next_position) + self.runtime_adjust_ms - self.chat_lead_ms()
+
+    def fire(self, msg, error = "", index = -1):
+        if(self.outbound is not None):
+            self.outbound.put(msg, index, self.telemetry)
+        else:
+            self.signals.privmsg.emit(msg, index)
+        self.log(f"Fired: {msg}{error}")
+
+    def progress(self, cur_evt_num, event_count, next_command, orig_index):
+        self.signals.progress.emit(cur_evt_num, event_count, next_command, orig_index)
+
+    def done(self, msg):
+        self.running = False
+        self.stats.stop()
+        self.log(msg)
+        self.log(self.stats.summary())
+        if(self.chat_latency is not None):
+            self.log(self.chat_latency.summary())
+        self.signals.done.emit(msg)
+
+    def log(self, msg, level=LogLevel.INFO):
+        self.signals.log.emit(msg, level)
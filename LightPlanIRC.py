@@ -0,0 +1,732 @@
+#Python Imports
+import ssl
+import time
+import random
+import socket
+import selectors
+import threading
+from array import array
+from enum import Enum, auto
+from collections import deque
+
+#LightPlan Imports
+from LightPlanCore import LogLevel, Callback, CueQueue, RateLimiter, TimingTelemetry, ChatLatency
+
+# Qt-free Twitch chat connection. TwitchIRC wraps this in a QRunnable for the
+# GUI and LightPlanCLI uses it directly, so both share the same logic.
+#
+# The connection is a plain non-blocking socket driven by a selector. The IRC
+# thread sleeps until the server sends something, a cue is queued or die() is
+# called; the last two write a byte to a socketpair to wake it.
+
+class ChatSignals():
+
+    def __init__(self):
+        self.log = Callback()
+        self.irc_disconnect = Callback()
+        self.irc_connect = Callback()
+        self.connect_failed = Callback()
+        self.reconnecting = Callback()
+
+
+class IRCMessage():
+    # One parsed line: "@tags :prefix COMMAND param param :trailing"
+
+    tag_escapes = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+    def __init__(self, prefix, command, params, tags=None):
+        self.prefix = prefix
+        self.command = command
+        self.params = params
+        self.tags = tags if tags is not None else {}
+
+    def nick(self):
+        if(self.prefix is None):
+            return ""
+        return self.prefix.split("!", 1)[0]
+
+    @staticmethod
+    def parse_tags(tag_str):
+        # IRCv3 message tags: key=value;key2=value2 with \s, \: etc escapes
+        tags = {}
+        for item in tag_str.split(";"):
+            key, _, value = item.partition("=")
+            if("\\" in value):
+                unescaped = []
+                escaped = False
+                for char in value:
+                    if(escaped):
+                        unescaped.append(IRCMessage.tag_escapes.get(char, char))
+                        escaped = False
+                    elif(char == "\\"):
+                        escaped = True
+                    else:
+                        unescaped.append(char)
+                value = "".join(unescaped)
+            tags[key] = value
+        return tags
+
+    @staticmethod
+    def parse(line):
+        tags = None
+        if(line.startswith("@")):
+            tag_str, _, line = line[1:].partition(" ")
+            tags = IRCMessage.parse_tags(tag_str)
+        prefix = None
+        if(line.startswith(":")):
+            prefix, _, line = line[1:].partition(" ")
+        line, _, trailing = line.partition(" :")
+        params = line.split()
+        if(len(params) == 0):
+            return None
+        command = params.pop(0).upper()
+        if(_):
+            params.append(trailing)
+        return IRCMessage(prefix, command, params, tags)
+
+
+class TwitchChat():
+
+    REGISTER_TIMEOUT = 15
+    RECV_SIZE = 4096
+    OUTBOUND_LIMIT = 64
+    # Reconnect backoff in seconds, doubling from BACKOFF_MIN
+    BACKOFF_MIN = 1
+    BACKOFF_MAX = 30
+    RECONNECT_ATTEMPTS = 10
+
+    def __init__(self, nickname, token, channel, server="irc.chat.twitch.tv", port=6667, signals=None, use_tls=False, stale_ms=2000, auto_reconnect=True, probe=False):
+        self._connect_failed = True
+        self.stop = False
+        self.signals = signals if signals is not None else ChatSignals()
+        self.connection = None
+        self.registered = False
+        self.server = server
+        self.port = port
+        self.use_tls = use_tls
+        self.nickname = nickname.lower()
+        # No token logs in anonymously (read only), see the latency probe
+        self.token = "oauth:"+token if token else None
+        if(len(channel) > 0 and channel[0] != "#"):
+            channel = "#"+channel
+        self.channel = channel.lower()
+        self.selector = None
+        self._recv_buffer = b""
+        self._send_buffer = bytearray()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        # Wire ready PRIVMSG lines keyed by command text, see prepare()
+        self.encoded = {}
+        self._prepared = {}
+        self.outbound = CueQueue(self.OUTBOUND_LIMIT)
+        self.outbound.waker = self.wake
+        self._reported_drops = 0
+        # Queue to socket write time of every cue sent, in ms
+        self.latency_ms = array("d")
+        # Reconnect state. Cues queued during an outage are sent once the
+        # connection is back, unless they are older than stale_ms
+        self.auto_reconnect = auto_reconnect
+        self.stale_ms = stale_ms
+        self.stale_dropped = 0
+        self.reconnect_at = None
+        self.reconnect_attempts = 0
+        self.reconnects = 0
+        self._auth_failed = False
+        self._register_deadline = None
+        # Latency probe: an anonymous connection to the same channel sees our
+        # PRIVMSGs with Twitch's tmi-sent-ts tag. Cues sent are remembered
+        # until their echo arrives and feed chat_latency
+        self.probe = probe
+        self.probe_chat = None
+        self.chat_latency = ChatLatency()
+        self.privmsg_handler = None
+        self._echo_pending = deque(maxlen=64)
+        self._echo_lock = threading.Lock()
+
+    def connected(self):
+        return self.connection is not None and self.registered
+
+    def reconnecting(self):
+        return self.reconnect_at is not None
+
+    def on_connect(self):
+        if(self.reconnect_attempts > 0 or not self._connect_failed):
+            self.reconnects += 1
+            self.log(f"Reconnected to {self.server}")
+        else:
+            self.log(f"Connected to {self.server}")
+        self._connect_failed = False
+        self.registered = True
+        self._register_deadline = None
+        self.reconnect_attempts = 0
+        self.send_line(f"JOIN {self.channel}")
+        self.signals.irc_connect.emit()
+        if(self.probe and self.probe_chat is None):
+            self.start_probe()
+        self.flush_outbound()
+
+    def on_join(self, message):
+        if(message.nick().lower() == self.nickname):
+            self.log(f"Joined channel {self.channel}")
+
+    def on_disconnect(self):
+        if(self._connect_failed):
+            self.log(f"{self.server} connection failed", LogLevel.ERROR)
+            self.signals.connect_failed.emit()
+        else:
+            self.log(f"Disconnected from {self.server}")
+            self.signals.irc_disconnect.emit()
+        self.stop = True
+
+    def on_message(self, message):
+        if(message.command == "PING"):
+            self.send_line("PONG :" + (message.params[-1] if message.params else self.server))
+        elif(message.command == "001"):
+            self.on_connect()
+        elif(message.command == "PRIVMSG"):
+            if(self.privmsg_handler is not None):
+                self.privmsg_handler(message, time.perf_counter())
+        elif(message.command == "JOIN"):
+            self.on_join(message)
+        elif(message.command == "NOTICE" and not self.registered):
+            # Twitch answers a bad token with a NOTICE and then hangs up
+            self._auth_failed = True
+            self.log(message.params[-1] if message.params else "Login failed", LogLevel.ERROR)
+        elif(message.command == "RECONNECT"):
+            # Twitch is about to restart this server, go now rather than
+            # waiting to be cut off
+            self.log(f"{self.server} asked us to reconnect")
+            self.close(backoff=False)
+
+    def privmsg(self, text, index=-1, telemetry=None):
+        # Safe from any thread; the IRC thread does the write. While
+        # reconnecting the cue waits in the queue
+        if(self.connected() or self.reconnecting()):
+            self.outbound.put(text, index, telemetry)
+            return True
+        return False
+
+    def encode_privmsg(self, text):
+        return f"PRIVMSG {self.channel} :{text}\r\n".encode("utf-8")
+
+    def prepare(self, schedule):
+        # Encode every command of a CompiledSchedule up front so sending a cue
+        # is a dict lookup and one send() call. Built aside and swapped in, so
+        # this is safe to call while the IRC thread is flushing. The previous
+        # schedule's lines are kept as well: the GUI prepares the next setlist
+        # song while the current one is still playing, and preparing it again
+        # when it starts only reuses what is already encoded.
+        previous = self._prepared
+        encoded = {}
+        for command in schedule.commands:
+            data = previous.get(command)
+            if(data is None):
+                data = self.encode_privmsg(command)
+            encoded[command] = data
+        self.encoded = {**previous, **encoded}
+        self._prepared = encoded
+
+    def rate_multiplier(self):
+        return 1
+
+    def prewarm(self):
+        # Called between songs. If the connection is down, skip the rest of
+        # the backoff so the login is done before the next LightPlan starts
+        if(self.reconnecting()):
+            self.reconnect_at = time.monotonic()
+            self.wake()
+
+    def flush_outbound(self):
+        # Runs on the IRC thread. While reconnecting cues stay queued; once
+        # connected, cues older than stale_ms are dropped instead of sent late
+        if(self.outbound.dropped != self._reported_drops):
+            self.log(f"Outbound queue full, dropped {self.outbound.dropped - self._reported_drops} cue(s)", LogLevel.ERROR)
+            self._reported_drops = self.outbound.dropped
+        if(not self.connected()):
+            if(not self.reconnecting()):
+                self.outbound.clear()
+            return
+        encoded = self.encoded
+        stale = 0
+        item = self.outbound.get()
+        while item is not None:
+            text, index, telemetry, queued = item
+            if(self.stale_ms is not None and (time.perf_counter() - queued) * 1000 > self.stale_ms):
+                stale += 1
+            else:
+                data = encoded.get(text)
+                if(data is None):
+                    data = self.encode_privmsg(text)
+                self.send_bytes(data)
+                sent = time.perf_counter()
+                self.latency_ms.append((sent - queued) * 1000)
+                if(self.probe_chat is not None):
+                    with self._echo_lock:
+                        self._echo_pending.append((text, sent, time.time() * 1000))
+                if(telemetry is not None):
+                    telemetry.mark_sent(index)
+                self.log(f"Sent: {text}", LogLevel.DEBUG)
+            if(not self.connected()):
+                return
+            item = self.outbound.get()
+        if(stale > 0):
+            self.stale_dropped += stale
+            self.log(f"Dropped {stale} stale cue(s) after reconnecting")
+
+    def send_line(self, line):
+        self.send_bytes((line + "\r\n").encode("utf-8"))
+
+    def send_bytes(self, data):
+        # Write straight away; anything the kernel wont take now goes out when
+        # the socket is writable again
+        if(self.connection is None):
+            return
+        if(len(self._send_buffer) == 0):
+            try:
+                sent = self.connection.send(data)
+            except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                sent = 0
+            except OSError as err:
+                self.log(f"Send failed: {err}", LogLevel.ERROR)
+                self.close()
+                return
+            if(sent == len(data)):
+                return
+            data = data[sent:]
+        self._send_buffer += data
+        self.selector.modify(self.connection, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+    def flush_send_buffer(self):
+        try:
+            sent = self.connection.send(self._send_buffer)
+        except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            return
+        except OSError as err:
+            self.log(f"Send failed: {err}", LogLevel.ERROR)
+            self.close()
+            return
+        del self._send_buffer[:sent]
+        if(len(self._send_buffer) == 0):
+            self.selector.modify(self.connection, selectors.EVENT_READ)
+
+    def receive(self):
+        # TLS can hold decrypted data the selector doesnt know about, so keep
+        # reading while the socket reports pending bytes
+        data = b""
+        while self.connection is not None:
+            try:
+                chunk = self.connection.recv(self.RECV_SIZE)
+            except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                break
+            except OSError as err:
+                self.log(f"Receive failed: {err}", LogLevel.ERROR)
+                self.close()
+                return
+            if(not chunk):
+                self.close()
+                return
+            data += chunk
+            if(not self.use_tls or self.connection.pending() == 0):
+                break
+        lines = (self._recv_buffer + data).split(b"\r\n")
+        self._recv_buffer = lines.pop()
+        for line in lines:
+            message = IRCMessage.parse(line.decode("utf-8", errors="replace"))
+            if(message is not None):
+                self.on_message(message)
+            if(self.connection is None):
+                return
+
+    def summary_lines(self):
+        lines = []
+        if(len(self.latency_ms) > 0):
+            lat = TimingTelemetry.describe(list(self.latency_ms))
+            lines.append(f"{self.nickname} {self.channel}: {lat['count']} cues, latency p50 {lat['p50']:.3f}ms p99 {lat['p99']:.3f}ms max {lat['max']:.3f}ms")
+        if(self.chat_latency.count > 0):
+            lines.append(self.chat_latency.summary())
+        return lines
+
+    def start_probe(self):
+        self.probe_chat = TwitchChat(f"justinfan{random.randint(10000, 99999)}", "", self.channel, self.server, self.port,
+            use_tls=self.use_tls)
+        self.probe_chat.signals.log.connect(self.probe_log)
+        self.probe_chat.privmsg_handler = self.on_echo
+        thread = threading.Thread(target=self.probe_chat.run, name=f"TwitchChat probe {self.channel}", daemon=True)
+        thread.start()
+
+    def probe_log(self, msg, level=LogLevel.INFO):
+        self.log(f"Latency probe: {msg}", LogLevel.DEBUG if level == LogLevel.INFO else level)
+
+    def on_echo(self, message, received):
+        # Runs on the probe thread. Matches the oldest pending cue with the
+        # same text; anything older than that was lost or rate limited
+        if(message.nick().lower() != self.nickname):
+            return
+        text = message.params[-1] if message.params else ""
+        with self._echo_lock:
+            match = None
+            for x in range(len(self._echo_pending)):
+                if(self._echo_pending[x][0] == text):
+                    match = x
+                    break
+            if(match is None):
+                return
+            for x in range(match):
+                self._echo_pending.popleft()
+            text, sent, sent_epoch_ms = self._echo_pending.popleft()
+        server_delta = None
+        if("tmi-sent-ts" in message.tags):
+            try:
+                server_delta = int(message.tags["tmi-sent-ts"]) - sent_epoch_ms
+            except ValueError:
+                pass
+        self.chat_latency.add((received - sent) * 1000, server_delta)
+
+    def wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            # A full pipe already guarantees a wake up
+            pass
+
+    def drain_wake(self):
+        try:
+            while self._wake_r.recv(self.RECV_SIZE):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def close(self, backoff=True):
+        if(self.connection is not None):
+            try:
+                self.selector.unregister(self.connection)
+            except (KeyError, ValueError):
+                pass
+            self.connection.close()
+            self.connection = None
+        self.registered = False
+        self._register_deadline = None
+        self._recv_buffer = b""
+        self._send_buffer.clear()
+        if(self.should_reconnect()):
+            self.schedule_reconnect(backoff)
+        else:
+            self.reconnect_at = None
+            self.on_disconnect()
+
+    def should_reconnect(self):
+        # Only a connection that logged in once is worth retrying; a bad token
+        # or an unreachable server on the first try is reported straight away
+        return (self.auto_reconnect and not self.stop and not self._connect_failed and not self._auth_failed
+            and self.reconnect_attempts < self.RECONNECT_ATTEMPTS)
+
+    def schedule_reconnect(self, backoff=True):
+        delay = 0
+        if(backoff):
+            delay = min(self.BACKOFF_MIN * (2 ** self.reconnect_attempts), self.BACKOFF_MAX)
+        self.reconnect_at = time.monotonic() + delay
+        self.log(f"Lost connection to {self.server}, reconnecting in {delay}s", LogLevel.ERROR if backoff else LogLevel.INFO)
+        self.signals.reconnecting.emit(float(delay))
+
+    def reconnect(self):
+        self.reconnect_at = None
+        self.reconnect_attempts += 1
+        try:
+            self.connect()
+        except OSError as err:
+            self.close()
+
+    def next_timeout(self):
+        # Only a pending login or reconnect needs a timeout, otherwise sleep
+        # until the socket or the wake pipe has something for us
+        deadlines = [x for x in (self._register_deadline, self.reconnect_at) if x is not None]
+        if(len(deadlines) == 0):
+            return None
+        return max(min(deadlines) - time.monotonic(), 0)
+
+    def check_timers(self):
+        now = time.monotonic()
+        if(self._register_deadline is not None and now >= self._register_deadline):
+            self.log(f"{self.server} did not answer the login", LogLevel.ERROR)
+            self.close()
+        if(self.reconnect_at is not None and now >= self.reconnect_at):
+            self.reconnect()
+
+    def disconnect(self):
+        self.die()
+
+    def run(self):
+        # The selector and the wake socketpair are closed however this ends,
+        # a failed first connect included
+        self.selector = selectors.DefaultSelector()
+        try:
+            self.selector.register(self._wake_r, selectors.EVENT_READ)
+            try:
+                self.connect()
+            except OSError as err:
+                self.signals.connect_failed.emit()
+                return
+
+            while not self.stop:
+                for key, events in self.selector.select(self.next_timeout()):
+                    if(key.fileobj is self._wake_r):
+                        self.drain_wake()
+                        self.flush_outbound()
+                    elif(self.connection is not None):
+                        if(events & selectors.EVENT_WRITE):
+                            self.flush_send_buffer()
+                        if(events & selectors.EVENT_READ and self.connection is not None):
+                            self.receive()
+                if(not self.stop):
+                    self.check_timers()
+            if(self.connection is not None):
+                try:
+                    self.connection.send(b"QUIT\r\n")
+                except OSError:
+                    pass
+                self.close()
+        finally:
+            self.selector.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def die(self):
+        self.stop = True
+        if(self.probe_chat is not None):
+            self.probe_chat.die()
+        self.wake()
+
+    def connect(self):
+        # The TCP connect, TLS handshake and PASS/NICK are done here; the IRC
+        # thread only reads once the socket is non-blocking
+        try:
+            self.connection = socket.create_connection((self.server, self.port), timeout=self.REGISTER_TIMEOUT)
+            if(self.use_tls):
+                context = ssl.create_default_context()
+                self.connection = context.wrap_socket(self.connection, server_hostname=self.server)
+        except OSError as err:
+            self.connection = None
+            self.log(repr(err), LogLevel.ERROR)
+            raise
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connection.setblocking(False)
+        self.selector.register(self.connection, selectors.EVENT_READ)
+        self._register_deadline = time.monotonic() + self.REGISTER_TIMEOUT
+        # Tags give us tmi-sent-ts, commands give RECONNECT and USERSTATE
+        self.send_line("CAP REQ :twitch.tv/tags twitch.tv/commands")
+        if(self.token is not None):
+            self.send_line(f"PASS {self.token}")
+        self.send_line(f"NICK {self.nickname}")
+
+    def log(self, msg, level=LogLevel.INFO):
+        self.signals.log.emit(msg, level)
+
+
+class PoolMode(Enum):
+    CHANNEL = auto()
+    ROUND_ROBIN = auto()
+
+    @staticmethod
+    def get(value):
+        if isinstance(value, PoolMode):
+            return value
+        for mode in PoolMode:
+            if(str(value).strip().upper().replace("-", "_") == mode.name):
+                return mode
+        return PoolMode.CHANNEL
+
+
+def pool_rate_multiplier(channels, mode):
+    # How many times one account's rate limit a pool with accounts on these
+    # channels can send: every account in ROUND_ROBIN, in CHANNEL mode the
+    # fewest accounts sharing a channel, since every channel gets every cue
+    if(len(channels) == 0):
+        return 1
+    if(PoolMode.get(mode) == PoolMode.ROUND_ROBIN):
+        return len(channels)
+    counts = {}
+    for channel in channels:
+        channel = channel.lower()
+        counts[channel] = counts.get(channel, 0) + 1
+    return min(counts.values())
+
+
+class TwitchPool():
+    # Several TwitchChat connections (bot accounts and/or channels) behind the
+    # TwitchChat interface. The pool is its own outbound queue: each cue put
+    # by the LightPlanPlayer is handed to member connections, either
+    #   CHANNEL     once per channel, rotating between the accounts on it
+    #   ROUND_ROBIN once in total, rotating between every connection
+    # skipping members whose rate budget is spent. When every candidate is
+    # over budget the one with the earliest free token is used.
+
+    def __init__(self, accounts, server="irc.chat.twitch.tv", port=6667, signals=None, use_tls=False, stale_ms=2000,
+            mode=PoolMode.CHANNEL, rate_limit=20, rate_window_ms=30000, probe=False):
+        self.signals = signals if signals is not None else ChatSignals()
+        self.mode = PoolMode.get(mode)
+        self.stop = False
+        self.members = []
+        self.limiters = []
+        self.over_budget = 0
+        self._failed = 0
+        self._was_connected = False
+        self._next = {}
+        self._lock = threading.Lock()
+        for nickname, token, channel in accounts:
+            member_signals = ChatSignals()
+            # One latency probe for the pool is enough, on the first member
+            chat = TwitchChat(nickname, token, channel, server, port, signals=member_signals, use_tls=use_tls, stale_ms=stale_ms,
+                probe=probe and len(self.members) == 0)
+            member_signals.log.connect(self.member_log(chat))
+            member_signals.irc_connect.connect(self.member_connected)
+            member_signals.irc_disconnect.connect(self.member_disconnected)
+            member_signals.connect_failed.connect(self.member_failed)
+            member_signals.reconnecting.connect(self.signals.reconnecting.emit)
+            self.members.append(chat)
+            self.limiters.append(RateLimiter(rate_limit, rate_window_ms))
+        self.channel = self.members[0].channel if len(self.members) > 0 else ""
+        self.chat_latency = self.members[0].chat_latency if len(self.members) > 0 else ChatLatency()
+        self.outbound = self
+
+    def member_log(self, chat):
+        def log(msg, level=LogLevel.INFO):
+            self.signals.log.emit(f"[{chat.nickname} {chat.channel}] {msg}", level)
+        return log
+
+    def member_connected(self):
+        # The pool counts as connected as soon as one member is
+        if(not self._was_connected):
+            self._was_connected = True
+            self.signals.irc_connect.emit()
+
+    def member_disconnected(self):
+        if(self._was_connected and not self.connected() and not self.reconnecting()):
+            self._was_connected = False
+            self.signals.irc_disconnect.emit()
+
+    def member_failed(self):
+        self._failed += 1
+        if(self._failed == len(self.members)):
+            self.signals.connect_failed.emit()
+        else:
+            self.member_disconnected()
+
+    def connected(self):
+        return any(chat.connected() for chat in self.members)
+
+    def reconnecting(self):
+        return any(chat.reconnecting() for chat in self.members)
+
+    def groups(self):
+        # Member indexes each cue is spread over
+        if(self.mode == PoolMode.ROUND_ROBIN):
+            return [list(range(len(self.members)))]
+        channels = {}
+        for index, chat in enumerate(self.members):
+            channels.setdefault(chat.channel, []).append(index)
+        return list(channels.values())
+
+    def pick(self, key, candidates, now_ms):
+        # Next usable member after the last one picked for this group
+        start = self._next.get(key, 0)
+        best = None
+        best_at = None
+        for step in range(len(candidates)):
+            index = candidates[(start + step) % len(candidates)]
+            chat = self.members[index]
+            if(not chat.connected() and not chat.reconnecting()):
+                continue
+            available = self.limiters[index].available_at(now_ms)
+            if(available <= now_ms):
+                self._next[key] = (start + step + 1) % len(candidates)
+                return index
+            if(best_at is None or available < best_at):
+                best = index
+                best_at = available
+        if(best is not None):
+            self.over_budget += 1
+            self._next[key] = (candidates.index(best) + 1) % len(candidates)
+        return best
+
+    def put(self, text, index=-1, telemetry=None):
+        now_ms = time.perf_counter() * 1000
+        with self._lock:
+            for key, candidates in enumerate(self.groups()):
+                member = self.pick(key, candidates, now_ms)
+                if(member is None):
+                    continue
+                self.limiters[member].take(now_ms)
+                self.members[member].outbound.put(text, index, telemetry)
+
+    def privmsg(self, text, index=-1, telemetry=None):
+        if(self.connected() or self.reconnecting()):
+            self.put(text, index, telemetry)
+            return True
+        return False
+
+    def clear(self):
+        for chat in self.members:
+            chat.outbound.clear()
+
+    def __len__(self):
+        return sum(len(chat.outbound) for chat in self.members)
+
+    def prepare(self, schedule):
+        for chat in self.members:
+            chat.prepare(schedule)
+
+    def rate_multiplier(self):
+        return pool_rate_multiplier([chat.channel for chat in self.members], self.mode)
+
+    def prewarm(self):
+        for chat in self.members:
+            chat.prewarm()
+
+    def summary(self):
+        # Per connection cue count and queue to write latency
+        result = []
+        for index, chat in enumerate(self.members):
+            result.append({
+                "nickname": chat.nickname,
+                "channel": chat.channel,
+                "connected": chat.connected(),
+                "reconnects": chat.reconnects,
+                "stale_dropped": chat.stale_dropped,
+                "latency_ms": TimingTelemetry.describe(list(chat.latency_ms))
+            })
+        return result
+
+    def summary_lines(self):
+        lines = []
+        for member in self.summary():
+            lat = member["latency_ms"]
+            if(lat["count"] == 0):
+                lines.append(f"{member['nickname']} {member['channel']}: no cues sent")
+            else:
+                lines.append(f"{member['nickname']} {member['channel']}: {lat['count']} cues, latency p50 {lat['p50']:.3f}ms p99 {lat['p99']:.3f}ms max {lat['max']:.3f}ms")
+        if(self.over_budget > 0):
+            lines.append(f"{self.over_budget} cue(s) sent over a connection's rate budget")
+        if(self.chat_latency.count > 0):
+            lines.append(self.chat_latency.summary())
+        return lines
+
+    def disconnect(self):
+        self.die()
+
+    def run(self):
+        threads = []
+        for chat in self.members:
+            thread = threading.Thread(target=chat.run, name=f"TwitchChat {chat.nickname} {chat.channel}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def die(self):
+        self.stop = True
+        for chat in self.members:
+            chat.die()
+
+    def log(self, msg, level=LogLevel.INFO):
+        self.signals.log.emit(msg, level)
@@ -0,0 +1,284 @@
+#Python Imports
+import json
+import time
+import socket
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+#LightPlan Imports
+from LightPlanCore import LogLevel, Callback, CueQueue
+
+# Output sinks take cues from the LightPlanPlayer instead of (or as well as)
+# Twitch chat. Every sink has the CueQueue interface the player already
+# writes to: put(text, index, telemetry), plus optional prepare(schedule)
+# to pre-encode a schedule's commands and close(). SinkRouter picks a sink
+# per event from the names compiled into the schedule.
+#
+# Sinks are configured by URL:
+#   udp://host:port              the command as a UTF-8 datagram
+#   osc://host:port/address      an OSC message with the command as a string
+#   http://host:port/path?query  POST a JSON body, by default the
+#                                LumiaStream local API chat-command format
+
+class SinkSignals():
+
+    def __init__(self):
+        self.log = Callback()
+
+
+class CallbackSink():
+    # Hands cues to a function, e.g. the GUI's privmsg slot or the CLI's
+    # dry run printer
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def put(self, text, index=-1, telemetry=None):
+        self.callback(text, index)
+
+    def clear(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class UDPSink():
+    # Sends from the runner thread: a datagram to a local host is a single
+    # non-blocking syscall, so theres nothing to gain from another thread
+
+    def __init__(self, host, port, osc_address=None, signals=None):
+        self.signals = signals if signals is not None else SinkSignals()
+        self.address = (host, port)
+        self.osc_address = osc_address
+        self.encoded = {}
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    @staticmethod
+    def osc_string(value):
+        data = value.encode("utf-8") + b"\0"
+        return data + b"\0" * (-len(data) % 4)
+
+    def encode(self, text):
+        if(self.osc_address is None):
+            return text.encode("utf-8")
+        return self.osc_string(self.osc_address) + self.osc_string(",s") + self.osc_string(text)
+
+    def prepare(self, schedule):
+        encoded = {}
+        for command in schedule.commands:
+            encoded[command] = self.encode(command)
+        self.encoded = encoded
+
+    def put(self, text, index=-1, telemetry=None):
+        data = self.encoded.get(text)
+        if(data is None):
+            data = self.encode(text)
+        if(telemetry is not None):
+            telemetry.mark_queued(index)
+        try:
+            self.socket.sendto(data, self.address)
+        except OSError as err:
+            self.log(f"UDP send to {self.address[0]}:{self.address[1]} failed: {err}", LogLevel.ERROR)
+            return
+        if(telemetry is not None):
+            telemetry.mark_sent(index)
+
+    def clear(self):
+        pass
+
+    def close(self):
+        self.socket.close()
+
+    def log(self, msg, level=LogLevel.INFO):
+        self.signals.log.emit(msg, level)
+
+
+class HTTPSink():
+    # POSTs each cue on its own thread over one keep-alive connection, so a
+    # slow endpoint never holds up the runner. body is a JSON template where
+    # {command} is replaced by the (JSON escaped) command text. As with
+    # TwitchChat, a slow or unreachable endpoint cant build up a backlog:
+    # the queue is bounded and cues older than stale_ms are dropped.
+
+    LUMIA_BODY = '{"type": "chat-command", "params": {"value": "{command}"}}'
+    TIMEOUT = 2
+    QUEUE_LIMIT = 64
+
+    def __init__(self, url, body=LUMIA_BODY, signals=None, stale_ms=2000):
+        self.signals = signals if signals is not None else SinkSignals()
+        parts = urlsplit(url)
+        self.url = url
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or "/"
+        if(parts.query):
+            self.path += "?" + parts.query
+        self.body = body
+        self.encoded = {}
+        self.connection = None
+        self.queue = CueQueue(self.QUEUE_LIMIT)
+        self.stale_ms = stale_ms
+        self.stale_dropped = 0
+        self._reported_drops = 0
+        self.stop = False
+        self.thread = threading.Thread(target=self.run, name=f"HTTPSink {self.host}", daemon=True)
+        self.thread.start()
+
+    def encode(self, text):
+        command = json.dumps(text)[1:-1]
+        return self.body.replace("{command}", command).encode("utf-8")
+
+    def prepare(self, schedule):
+        encoded = {}
+        for command in schedule.commands:
+            encoded[command] = self.encode(command)
+        self.encoded = encoded
+
+    def put(self, text, index=-1, telemetry=None):
+        self.queue.put(text, index, telemetry)
+
+    def clear(self):
+        self.queue.clear()
+
+    def connect(self):
+        if(self.scheme == "https"):
+            self.connection = http.client.HTTPSConnection(self.host, self.port, timeout=self.TIMEOUT)
+        else:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.TIMEOUT)
+        self.connection.connect()
+        self.connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def post(self, data):
+        # One retry covers a keep-alive connection the server has closed
+        for attempt in range(2):
+            try:
+                if(self.connection is None):
+                    self.connect()
+                self.connection.request("POST", self.path, data, {"Content-Type": "application/json"})
+                response = self.connection.getresponse()
+                response.read()
+                if(response.status >= 400):
+                    self.log(f"{self.url} returned {response.status} {response.reason}", LogLevel.ERROR)
+                return True
+            except (OSError, http.client.HTTPException) as err:
+                if(self.connection is not None):
+                    self.connection.close()
+                    self.connection = None
+                if(attempt == 1):
+                    self.log(f"POST to {self.url} failed: {err}", LogLevel.ERROR)
+        return False
+
+    def run(self):
+        while not self.stop:
+            self.queue.wait()
+            if(self.queue.dropped != self._reported_drops):
+                self.log(f"{self.url} queue full, dropped {self.queue.dropped - self._reported_drops} cue(s)", LogLevel.ERROR)
+                self._reported_drops = self.queue.dropped
+            stale = 0
+            item = self.queue.get()
+            while item is not None and not self.stop:
+                text, index, telemetry, queued = item
+                if(self.stale_ms is not None and (time.perf_counter() - queued) * 1000 > self.stale_ms):
+                    stale += 1
+                    item = self.queue.get()
+                    continue
+                data = self.encoded.get(text)
+                if(data is None):
+                    data = self.encode(text)
+                if(self.post(data) and telemetry is not None):
+                    telemetry.mark_sent(index)
+                item = self.queue.get()
+            if(stale > 0):
+                self.stale_dropped += stale
+                self.log(f"Dropped {stale} stale cue(s) for {self.url}", LogLevel.ERROR)
+        if(self.connection is not None):
+            self.connection.close()
+
+    def close(self):
+        self.stop = True
+        self.queue.interrupt()
+
+    def log(self, msg, level=LogLevel.INFO):
+        self.signals.log.emit(msg, level)
+
+
+class SinkRouter():
+    # Sends each cue to the sink its event names, or to the default output
+    # (normally Twitch chat). Unknown sink names fall back to the default.
+
+    def __init__(self, default, sinks=None, signals=None):
+        self.signals = signals if signals is not None else SinkSignals()
+        self.default = default
+        self.sinks = dict(sinks) if sinks is not None else {}
+        self.schedule = None
+        self.targets = ()
+
+    def prepare(self, schedule):
+        self.schedule = schedule
+        targets = []
+        for name in schedule.sinks:
+            sink = self.sinks.get(name)
+            if(sink is None and name != "chat"):
+                self.log(f"Unknown output sink '{name}', using the default", LogLevel.ERROR)
+            targets.append(sink if sink is not None else self.default)
+        self.targets = tuple(targets)
+        for sink in self.sinks.values():
+            if(hasattr(sink, "prepare")):
+                sink.prepare(schedule)
+
+    def put(self, text, index=-1, telemetry=None):
+        target = self.default
+        if(index >= 0 and self.schedule is not None):
+            sink_index = self.schedule.sink_index(index)
+            if(sink_index >= 0):
+                target = self.targets[sink_index]
+        if(target is not None):
+            target.put(text, index, telemetry)
+
+    def clear(self):
+        if(self.default is not None):
+            self.default.clear()
+        for sink in self.sinks.values():
+            sink.clear()
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
+
+    def log(self, msg, level=LogLevel.INFO):
+        self.signals.log.emit(msg, level)
+
+
+def create_sink(url, signals=None, stale_ms=2000):
+    parts = urlsplit(url)
+    if(parts.scheme in ("udp", "osc")):
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        if(not parts.hostname or port is None):
+            raise ValueError(f"Output sink needs a host and port: {url}")
+    if(parts.scheme == "udp"):
+        return UDPSink(parts.hostname, parts.port, signals=signals)
+    if(parts.scheme == "osc"):
+        return UDPSink(parts.hostname, parts.port, parts.path or "/lightplan", signals=signals)
+    if(parts.scheme in ("http", "https")):
+        return HTTPSink(url, signals=signals, stale_ms=stale_ms)
+    raise ValueError(f"Unsupported output sink: {url}")
+
+def create_sinks(specs, signals=None, stale_ms=2000):
+    # {name: url} to {name: sink}
+    # Nothing is left running if one of the URLs is bad
+    sinks = {}
+    try:
+        for name, url in specs.items():
+            sinks[name] = create_sink(url, signals, stale_ms)
+    except ValueError:
+        for sink in sinks.values():
+            sink.close()
+        raise
+    return sinks
@@ -14,12 +14,14 @@ import unicodedata
 import re
 import platform
 import subprocess
+import multiprocessing
 
 # PySide6 Imports
 from PySide6.QtWidgets import (QApplication, QMainWindow, QStyle, 
                             QDialog, QInputDialog, QSplashScreen, 
                             QMessageBox,QAbstractItemView, 
-                            QLineEdit, QFileDialog, QMenu, QTableWidgetItem)
+                            QLineEdit, QFileDialog, QMenu, QTableWidgetItem,
+                            QVBoxLayout, QLabel, QListWidget, QListWidgetItem)
 from PySide6.QtCore import (QFile, Slot, Signal, QObject, QStandardPaths,
                             QSettings, QTextStream, Qt, QTimer, QThreadPool, QFileSystemWatcher, \
                             QUrl, QSize)
@@ -80,6 +82,7 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         self.default_lightplan_dir = os.path.join(self.config_dir, "LightPlans").replace("\\", "/")
         self.audio_dir = os.path.join(self.config_dir, "Audio").replace("\\", "/")
         self.lp_db_path = os.path.join(self.config_dir, "lightplan.db").replace("\\", "/")
+        self.report_dir = os.path.join(self.config_dir, "Reports").replace("\\", "/")
 
         os.makedirs(self.default_lightplan_dir, exist_ok=True)
         if(not os.path.isdir(self.default_lightplan_dir)):
@@ -174,6 +177,9 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         self.lp_tree_context_delete_action = QAction("Delete LightPlan")
         self.lp_tree_context_menu.addAction(self.lp_tree_context_delete_action)
         self.lp_tree_context_delete_action.triggered.connect(self.lp_tree_delete_clicked)
+        self.lp_tree_context_setlist_action = QAction("Add To Setlist")
+        self.lp_tree_context_menu.addAction(self.lp_tree_context_setlist_action)
+        self.lp_tree_context_setlist_action.triggered.connect(self.lp_tree_setlist_clicked)
         self.lp_tree_view.setContextMenuPolicy(Qt.CustomContextMenu)
         self.lp_tree_view.customContextMenuRequested.connect(self.lptree_show_context_menu)
         int_validator = QIntValidator(self)
@@ -210,6 +216,8 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         self.resume_on_release = False
         self.lightplan_files = []
         self.file_watcher = None
+        self.lp_scanner = None
+        self.lp_scan_pending = False
         self.status_msg = "Welcome to LightPlan Studio"
         self.lightplan_start_timer = QTimer()
         self.lightplan_start_timer.timeout.connect(self.update_lightplan_elapsed)
@@ -219,9 +227,21 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         self.lightplan_runner = None
         self.keyevent_eater = KeyEventEater()
         self.insert_event_button.installEventFilter(self.keyevent_eater)
-        self.expanded_tree_items = []
         self.custom_cmds = []
         self.ssl_queue_buttons = []
+        self.song_loaded = False
+        self.rehearsal_clock = None
+        self.rehearsal_dialog = None
+        self.rehearsal_timer = QTimer()
+        self.rehearsal_timer.timeout.connect(self.sync_rehearsal_clock)
+        self.setlist = []
+        self.setlist_next = None
+        self.setlist_start_pending = False
+        # Editor contents with unsaved changes that a setlist song replaced
+        self.unsaved_lightplans = []
+        self.output_router = None
+        self.sink_signals = SinkLogSignals()
+        self.sink_signals.log.connect(self.log)
 
         # Check for updated commands if UpdateCmdsOnStart = True
         update_cmds = valueToBool(self.settings.value("LightPlanStudio/UpdateCmdsOnStart", False))
@@ -259,6 +279,29 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         self.action_help_checkcmds.triggered.connect(self.menu_click)
         self.statusbar.messageChanged.connect(self.status_msg_changed)
 
+        # LightPlan Menu
+        self.menu_lightplan = QMenu("&LightPlan", self)
+        self.menubar.insertMenu(self.menu_Help.menuAction(), self.menu_lightplan)
+        self.action_seek_lp = QAction("&Seek / Start At Song Position...", self)
+        self.action_seek_lp.setShortcut("Ctrl+K")
+        self.menu_lightplan.addAction(self.action_seek_lp)
+        self.action_seek_lp.triggered.connect(self.menu_click)
+        self.action_rehearse_lp = QAction("&Rehearse With Local Audio", self)
+        self.action_rehearse_lp.setShortcut("Ctrl+R")
+        self.menu_lightplan.addAction(self.action_rehearse_lp)
+        self.action_rehearse_lp.triggered.connect(self.menu_click)
+        self.action_check_rate = QAction("Check Twitch &Rate Limits", self)
+        self.menu_lightplan.addAction(self.action_check_rate)
+        self.action_check_rate.triggered.connect(self.menu_click)
+        self.menu_lightplan.addSeparator()
+        self.action_setlist_next = QAction("Start &Next In Setlist", self)
+        self.action_setlist_next.setShortcut("Ctrl+Right")
+        self.menu_lightplan.addAction(self.action_setlist_next)
+        self.action_setlist_next.triggered.connect(self.menu_click)
+        self.action_setlist_clear = QAction("&Clear Setlist", self)
+        self.menu_lightplan.addAction(self.action_setlist_clear)
+        self.action_setlist_clear.triggered.connect(self.menu_click)
+
         # Button Signals
         self.ssl_lookup_button.clicked.connect(self.show_ssl_match_dialog)
         self.debug_hidelog_button.clicked.connect(self.click_hidelog_button)
@@ -293,18 +336,30 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         self.check_showlog()
         self.set_status(self.status_msg)
 
+        #Create Connection to LightPlan SQLite DB
+        self.lightplan_db = LightPlanDB(self.lp_db_path)
+        self.lightplan_db.signals.log.connect(self.log)
+        self.log(f"LightPlan Database: {self.lightplan_db.count_lightplans()} LightPlans", LogLevel.DEBUG)
+
         # LightPlan Explorer Tab
         self.lp_tree_model = LightPlanTreeModel()
         self.lp_tree_model.setHorizontalHeaderLabels(['LightPlans'])
         self.lp_tree_view.setModel(self.lp_tree_model)
+        self.lp_tree_builder = LightPlanTreeBuilder(self.lp_tree_model, self.lightplan_dir, self.dir_icon, self.lightplan_icon)
         self.lp_tree_view.setDragDropMode(QAbstractItemView.DropOnly)
         self.lp_tree_view.viewport().setAcceptDrops(True)
         self.lp_tree_view.setAcceptDrops(True)
         self.lp_tree_view.setDropIndicatorShown(True)
         self.lp_tree_view.setIndentation(12)
         self.lp_tree_view.doubleClicked.connect(self.lp_tree_doubleclicked)
-        self.lp_tree_view.expanded.connect(self.lptree_item_expanded)
-        self.lp_tree_view.collapsed.connect(self.lptree_item_collapsed)
+        # Search replaces the tree with a result list while there is text
+        self.lp_search_results.hide()
+        self.lp_search_results.itemDoubleClicked.connect(self.lp_search_doubleclicked)
+        self.lp_search_timer = QTimer()
+        self.lp_search_timer.setSingleShot(True)
+        self.lp_search_timer.setInterval(150)
+        self.lp_search_timer.timeout.connect(self.lp_search)
+        self.lp_search_edit.textChanged.connect(self.lp_search_timer.start)
         self.reset_fswatcher()
 
         # StreamerSongList Integration
@@ -315,12 +370,6 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         self.current_lightplan["lightplan"] = self.lightplan_gui_to_dict()
         self.current_lightplan["md5"] = hashlib.md5(str(self.current_lightplan["lightplan"]).encode("utf-8")).hexdigest()
 
-        #Create Connection to LightPlan SQLite DB
-        self.lightplan_db = LightPlanDB(self.lp_db_path)
-        self.lightplan_db.signals.log.connect(self.log)
-        lps = self.lightplan_db.fetch_all_lightplans()
-        print(lps)
-
         # Initialize Window Geometry
         geometry = self.settings.value("LightPlanStudio/geometry")
         window_state = self.settings.value("LightPlanStudio/windowState")
@@ -339,8 +388,6 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         elif(sender == self.action_save_lp):
             self.click_save_button()
         elif(sender == self.action_import_lp):
-            self.log("Ohhh a new feature is coming!", LogLevel.INFO)
-            self.log("Import LightPlan - not implemented yet", LogLevel.DEBUG)
             self.import_lightplans()
         elif(sender == self.action_export_lp):
             self.log("Ohhh a new feature is coming!", LogLevel.INFO)
@@ -356,12 +403,24 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         elif(sender == self.action_show_log):
             self.toggle_logvisible()
         elif(sender == self.action_help_about):
-            self.get_expanded_tree_objs()
             QMessageBox.about(self, "LightPlan Studio", self.about_text)
         elif(sender == self.action_help_oauth):
             QDesktopServices.openUrl(QUrl("https://www.twitchapps.com/tmi/"))
         elif(sender == self.action_help_docs):
             QDesktopServices.openUrl(QUrl("http://lightplanstudio.com/wiki/doku.php"))
+        elif(sender == self.action_seek_lp):
+            self.click_seek_lightplan()
+        elif(sender == self.action_rehearse_lp):
+            self.click_rehearse_lightplan()
+        elif(sender == self.action_check_rate):
+            self.show_rate_limit_check()
+        elif(sender == self.action_setlist_next):
+            self.start_next_in_setlist()
+        elif(sender == self.action_setlist_clear):
+            self.setlist.clear()
+            self.setlist_next = None
+            self.log("Setlist Cleared")
+            self.update_setlist_status()
         elif(sender == self.action_help_checkcmds):
             cmds = self.fetch_commands()
             if(cmds["commands"] is not None and cmds["commands"] != self.defaultCommands):
@@ -473,138 +532,84 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         if(self.file_watcher is not None):
             del self.file_watcher
         self.file_watcher = QFileSystemWatcher()
-        self.refresh_lptree()
         self.file_watcher.addPath(self.lightplan_dir)
-        for root, dirs, files in os.walk(self.lightplan_dir):
-            for dir in dirs:
-                self.file_watcher.addPath(os.path.join(root, dir))
         self.file_watcher.directoryChanged.connect(self.refresh_lptree)
-
-    def get_expanded_tree_objs(self):
-        expanded = []
-        indexes = self.lp_tree_model.persistentIndexList()
-        for index in indexes:
-            if(self.lp_tree_view.isExpanded(index)):
-                path = []
-                data = index.data()
-                path.append(data)
-                parent = index.parent()
-                parent_data = parent.data()
-                while parent_data is not None:
-                    path.append(parent.data())
-                    parent = parent.parent()
-                    parent_data = parent.data()
-                expanded.append(path)
-        return expanded
+        # Sub directories are watched once the scan has found them
+        self.refresh_lptree()
 
     def refresh_lptree(self, path=None):
-        self.lp_tree_model.clear()
-        self.lp_tree_model.setHorizontalHeaderLabels(['LightPlans'])
-        self.lightplan_files = []
-        result = sorted(Path(self.lightplan_dir).rglob("*.plan"))
-        lightplan = {}
-        for plan in result:
-            with open(plan, 'r') as json_file:
-                try:
-                    obj = {}
-                    lightplan = json.load(json_file)
-                    if("song_artist" not in lightplan or "song_title" not in lightplan):
-                        continue
-                    obj["path"] = plan.__str__().replace("\\", "/")
-                    # If parent directory not the lightplan dir, add a parent item
-                    dir_path = os.path.dirname(obj["path"])
-                    if(dir_path and dir_path != self.lightplan_dir):
-                        dir = os.path.basename(dir_path)
-                        parent_items = self.lp_tree_model.findItems(dir)
-                        if(len(parent_items) == 0):
-                            # Create Parent Item if it doesnt exist
-                            parent = QStandardItem(dir)
-                            parent.setEditable(False)
-                            parent.setData(dir, Qt.DisplayRole)
-                            parent.setData("Directory", Qt.UserRole)
-                            parent.setIcon(self.dir_icon)
-                            self.lp_tree_model.appendRow(parent)
-                            obj["parent"] = parent
-                        else:
-                            obj["parent"] = parent_items[0]
-                    else:
-                        obj["parent"] = None
-                    obj["artist"] = lightplan["song_artist"]
-                    obj["title"] = lightplan["song_title"]
-                    obj["ssl_id"] = lightplan["ssl_id"]
-                    self.lightplan_files.append(obj)
-                except ValueError as err:
-                    self.log(repr(err), LogLevel.ERROR)
-                    continue
-
-        ## Now assume all items have had their parent created
-        for lp in self.lightplan_files:
-            item = QStandardItem(lp["title"])
-            item.setEditable(False)
-            item.setData(lp["path"], Qt.UserRole)
-            item.setData(lp["title"], Qt.DisplayRole)
-            item.setIcon(self.lightplan_icon)
-            artist_item = None
-            artist_items = self.lp_tree_model.findItems(lp["artist"], Qt.MatchExactly)
-
-            # Match the artist name to the artist item with the correct parent
-            for ai in artist_items:
-                if(ai.parent() == lp["parent"]):
-                    artist_item = ai
-                    break
-            
-            # If artist not matched, create the artist item with correct parent
-            if(artist_item is None):
-                artist_item = QStandardItem(lp["artist"])
-                artist_item.setEditable(False)
-                artist_item.setData(lp["artist"], Qt.DisplayRole)
-                artist_item.setData("Artist", Qt.UserRole)
-                if(lp["parent"] is not None):
-                    lp["parent"].appendRow(artist_item)
-                else:
-                    self.lp_tree_model.appendRow(artist_item)
-            # Add the song item to the artist item
-            artist_item.appendRow(item)
-
-        # Expand the items previous expanded
-        c = self.lp_tree_model.rowCount()
-        temp_list = []
-        for x in range(0, c):
-            index = self.lp_tree_model.index(x, 0)
-            index_str = self.treeindex_to_str(index)
-            if(index_str in self.expanded_tree_items):
-                self.lp_tree_view.expand(index)
-                temp_list.append(index_str)
-            num_children = self.lp_tree_model.rowCount(index)
-            for y in range(0, num_children):
-                child_index = self.lp_tree_model.index(y, 0, index)
-                child_index_str = self.treeindex_to_str(child_index)
-                if(child_index_str in self.expanded_tree_items):
-                    self.lp_tree_view.expand(child_index)
-                    temp_list.append(child_index_str)
-        self.expanded_tree_items = temp_list.copy()
-
-    def treeindex_to_str(self, index):
-        index_list = []
-        index_list.append(index.data())
-        parent = index.parent()
-        p_data = parent.data()
-        while p_data is not None:
-            index_list.append(p_data)
-            parent = parent.parent()
-            p_data = parent.data()
-        return ','.join(index_list)
-
-    def lptree_item_expanded(self, index):
-        index_str = self.treeindex_to_str(index)
-        if(index_str not in self.expanded_tree_items):
-            self.expanded_tree_items.append(index_str)
-
-    def lptree_item_collapsed(self, index):
-        index_str = self.treeindex_to_str(index)
-        if(index_str in self.expanded_tree_items):
-            self.expanded_tree_items.remove(index_str)
-                    
+        # The scan runs in the background. Changes while it runs (an editor
+        # saving several files, say) are picked up by one more scan after it.
+        if(self.lp_scanner is not None):
+            self.lp_scan_pending = True
+            return
+        self.lp_scan_pending = False
+        # The LightPlan directory can be changed in the settings
+        self.lp_tree_builder.root = self.lightplan_dir
+        self.lp_scanner = LightPlanScanner(self.lp_db_path, self.lightplan_dir)
+        self.lp_scanner.signals.log.connect(self.log)
+        self.lp_scanner.signals.batch.connect(self.lptree_scan_batch)
+        self.lp_scanner.signals.done.connect(self.lptree_scan_done)
+        self.threadpool.start(self.lp_scanner)
+
+    def lptree_scan_batch(self, headers):
+        self.lp_tree_builder.update(headers)
+
+    def lptree_scan_done(self, paths, dirs):
+        self.lp_scanner = None
+        if(paths is not None):
+            self.lp_tree_builder.prune(paths)
+        self.lightplan_files = self.lp_tree_builder.headers()
+        watched = set(self.file_watcher.directories())
+        new_dirs = [dir for dir in dirs if dir not in watched]
+        if(len(new_dirs) > 0):
+            self.file_watcher.addPaths(new_dirs)
+        if(self.lp_scan_pending):
+            self.refresh_lptree()
+
+    def lp_search(self):
+        text = self.lp_search_edit.text().strip()
+        self.lp_search_results.clear()
+        if(len(text) == 0):
+            self.lp_search_results.hide()
+            self.lp_tree_view.show()
+            return
+        start = time.perf_counter()
+        # Files in the LightPlan directory first, then the library. A file
+        # result holds its path, a library result its lightplan_id.
+        files = self.lightplan_db.search_files(text)
+        results = self.lightplan_db.search(text)
+        for path, artist, title in files:
+            item = QListWidgetItem(f"{artist} - {title}")
+            item.setData(Qt.UserRole, path)
+            item.setToolTip(path)
+            self.lp_search_results.addItem(item)
+        for lightplan_id, artist, title in results:
+            item = QListWidgetItem(f"{artist} - {title} (library)")
+            item.setData(Qt.UserRole, lightplan_id)
+            self.lp_search_results.addItem(item)
+        if(len(files) == 0 and len(results) == 0):
+            item = QListWidgetItem("No LightPlans found")
+            item.setFlags(Qt.NoItemFlags)
+            self.lp_search_results.addItem(item)
+        self.log(f"Search '{text}': {len(files)} files, {len(results)} library LightPlans in {(time.perf_counter() - start)*1000:.1f}ms", LogLevel.DEBUG)
+        self.lp_tree_view.hide()
+        self.lp_search_results.show()
+
+    def lp_search_doubleclicked(self, item):
+        data = item.data(Qt.UserRole)
+        if(data is None):
+            return
+        if(isinstance(data, str)):
+            self.check_save_lightplan()
+            self.open_lp_file(data)
+            return
+        lightplan_dict = self.lightplan_db.fetch_lightplan(data)
+        if(lightplan_dict is None):
+            return
+        self.check_save_lightplan()
+        self.show_lightplan(lightplan_dict, None)
+
     def lp_tree_doubleclicked(self):
         index = self.lp_tree_view.selectedIndexes()[0]
         selected = index.model().itemFromIndex(index)
@@ -613,6 +618,13 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
             self.check_save_lightplan()
             self.open_lp_file(data)
 
+    def lp_tree_setlist_clicked(self):
+        index = self.lp_tree_view.currentIndex()
+        selected = index.model().itemFromIndex(index)
+        if(selected is None or selected.data(Qt.UserRole) in ["Artist", "Directory"]):
+            return
+        self.setlist_add(selected.data(Qt.UserRole))
+
     def lptree_show_context_menu(self):
         self.lp_tree_context_menu.popup(QCursor.pos())
 
@@ -674,14 +686,20 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
     def import_lightplans(self):
         self.log("Import LP", LogLevel.DEBUG)
         file_name = QFileDialog.getOpenFileNames(self, "Import LightPlans", self.lightplan_dir, "LightPlans (*.plan)")
-        if(file_name):
-            for f in file_name[0]:
-                self.log(f"Importing LightPlan {f}", LogLevel.DEBUG)
-                with open(f) as plan:
-                    lp = json.load(plan)
-                    self.lightplan_db.import_lightplan(lp)
-                    break
-                    
+        if(file_name and len(file_name[0]) > 0):
+            self.log(f"Importing {len(file_name[0])} LightPlans", LogLevel.INFO)
+            self.set_status(f"Importing {len(file_name[0])} LightPlans...")
+            importer = LightPlanImporter(self.lp_db_path, file_name[0])
+            importer.signals.log.connect(self.log)
+            importer.signals.done.connect(self.import_lightplans_done)
+            self.threadpool.start(importer)
+
+    def import_lightplans_done(self, report):
+        for path, error in report.errors:
+            self.log(f"Could not import {os.path.basename(path)}: {error}", LogLevel.ERROR)
+        self.log(report.summary(), LogLevel.INFO)
+        self.set_status(report.summary())
+
 
     def check_save_lightplan(self):
         if(self.checkLightPlanUpdated()):
@@ -693,6 +711,39 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
                 if(self.save_light_plan()):
                     QMessageBox.information(self, "LightPlan Studio", "LightPlan Saved")
 
+    def stash_unsaved_lightplan(self):
+        # A setlist song is about to replace the editor contents. Asking now
+        # would hold up the song, so unsaved changes are set aside and
+        # offered after the song (see offer_unsaved_lightplans)
+        if(not self.checkLightPlanUpdated()):
+            return
+        lightplan = self.lightplan_gui_to_dict()
+        self.unsaved_lightplans.append({
+            "path": self.current_lightplan["path"],
+            "md5": self.current_lightplan["md5"],
+            "lightplan": lightplan
+        })
+        self.log(f"Setlist: Kept unsaved changes to {lightplan['song_artist']} - {lightplan['song_title']}, you will be asked to save them after the song")
+
+    def offer_unsaved_lightplans(self):
+        while(len(self.unsaved_lightplans) > 0):
+            unsaved = self.unsaved_lightplans[0]
+            lightplan = unsaved["lightplan"]
+            ret = QMessageBox.question(self, "LightPlan Studio",
+                f"{lightplan['song_artist']} - {lightplan['song_title']} had unsaved changes when a setlist song replaced it in the editor.\nDo you want to save your changes?",
+                QMessageBox.Save,
+                QMessageBox.Discard)
+            self.unsaved_lightplans.pop(0)
+            if(ret != QMessageBox.Save):
+                continue
+            # Saved through the editor, the same way as any other save
+            self.show_lightplan(lightplan, unsaved["path"])
+            self.current_lightplan["md5"] = unsaved["md5"]
+            if(not self.save_light_plan()):
+                # Left in the editor to finish, e.g. without an artist or title
+                return
+            QMessageBox.information(self, "LightPlan Studio", "LightPlan Saved")
+
     def show_file_dialog(self):
         file_name = QFileDialog.getOpenFileName(self, "Open LightPlan", self.lightplan_dir, "LightPlans (*.plan)")
         if(file_name):
@@ -709,6 +760,9 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         except json.JSONDecodeError as err:
             self.log(str(err), LogLevel.ERROR)
             return
+        self.show_lightplan(lightplan_dict, lp_path)
+
+    def show_lightplan(self, lightplan_dict, lp_path):
         self.clear_lightplan()
         self.lp_songtitle_edit.setText(lightplan_dict["song_title"])
         self.lp_artist_edit.setText(lightplan_dict["song_artist"])
@@ -726,7 +780,7 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         self.start_event_edit.setText(msToStr(lightplan_dict["starting_ms"], True))
         self.lp_table_model.clear_events()
         for evt in lightplan_dict["events"]:
-            evt_obj = LightPlanEvent(evt["offset"],evt["command"],evt["comment"],valueToBool(evt["ignore_delay"]))
+            evt_obj = LightPlanEvent(evt["offset"],evt["command"],evt["comment"],valueToBool(evt["ignore_delay"]),evt.get("sink"),evt.get("profile"))
             self.lp_table_model.insert_event(evt_obj)
         self.current_lightplan = {
             "path": lp_path,
@@ -734,7 +788,11 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
             "lightplan": lightplan_dict
         }
         self.update_progressbar()
-        self.set_status(self.current_lightplan["path"])
+        if(lp_path is None):
+            # Opened from the database, saving creates the .plan file
+            self.set_status(f"{lightplan_dict['song_artist']} - {lightplan_dict['song_title']} (from the LightPlan library)")
+        else:
+            self.set_status(self.current_lightplan["path"])
 
     def checkLightPlanUpdated(self):
         lp = self.lightplan_gui_to_dict()
@@ -770,6 +828,10 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         lightplan_dict["notes"] = self.lp_notes_edit.toPlainText().strip()
         lightplan_dict["starting_ms"] = strToMs(self.start_event_edit.text().strip())
         lightplan_dict["events"] = self.lp_table_model.exportJsonDict()
+        # Plan settings without an editor in the GUI are carried over as loaded
+        for key in ("sink", "profile", "latency_profiles"):
+            if(key in self.current_lightplan.get("lightplan", {})):
+                lightplan_dict[key] = self.current_lightplan["lightplan"][key]
         return lightplan_dict
     
     def save_light_plan(self):
@@ -824,47 +886,292 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
     def click_start_lightplan(self):
         #LightPlan Not Running - Start It
         if(self.lightplan_runner is None or self.lightplan_runner.is_running() == False):
-            self.lp_songtitle_edit.setEnabled(False)
-            self.lp_artist_edit.setEnabled(False)
-            self.lp_author_edit.setEnabled(False)
-            self.lp_sslid_edit.setEnabled(False)
-            self.lp_spotifyid_edit.setEnabled(False)
-            self.lp_youtubeurl_edit.setEnabled(False)
-            self.lp_notes_edit.setEnabled(False)
-            self.start_event_edit.setEnabled(False)
-            self.event_table_view.setEnabled(False)
-            self.load_song_button.setEnabled(False)
-            self.insert_event_button.setEnabled(False)
-            self.set_delay_button.setEnabled(False)
-            self.calc_delay_button.setEnabled(False)
-            self.twitch_connect_button.setEnabled(False)
-            self.action_new_lp.setEnabled(False)
-            self.action_open_lp.setEnabled(False)
-            self.action_save_lp.setEnabled(False)
-            self.action_settings.setEnabled(False)
-            self.action_help_about.setEnabled(False)
-            self.action_help_oauth.setEnabled(False)
-            self.action_help_docs.setEnabled(False)
-            self.action_help_checkcmds.setEnabled(False)
-            self.event_table_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
-            lp = self.lightplan_gui_to_dict()
-            self.control_lp_progressbar.setValue(0)
-            self.lightplan_runner = LightPlanRunner(lp, self.stream_delay_ms, self.delay_adjust_ms)
-            self.lightplan_runner.signals.log.connect(self.log)
-            self.lightplan_runner.signals.done.connect(self.lightplan_runner_done)
-            self.lightplan_runner.signals.progress.connect(self.lightplan_runner_progress)
-            self.lightplan_runner.signals.privmsg.connect(self.privmsg)
-            self.threadpool.start(self.lightplan_runner)
-            self.lightplan_start_timer.start(0.2)
-            self.lightplan_start_time = time.time()
-            self.next_event_secs = 0
-            self.set_status("LightPlan Started", 2500)
-            self.control_startlp_button.setText("Stop LightPlan")
+            self.start_lightplan()
         else:
             #LightPlan Already Running - Stop It
             self.lightplan_runner.stop()
             self.control_startlp_button.setText("Start LightPlan")
 
+    def start_lightplan(self, seek_ms=None, rehearsal=False, prepared=None):
+        self.lp_songtitle_edit.setEnabled(False)
+        self.lp_artist_edit.setEnabled(False)
+        self.lp_author_edit.setEnabled(False)
+        self.lp_sslid_edit.setEnabled(False)
+        self.lp_spotifyid_edit.setEnabled(False)
+        self.lp_youtubeurl_edit.setEnabled(False)
+        self.lp_notes_edit.setEnabled(False)
+        self.start_event_edit.setEnabled(False)
+        self.event_table_view.setEnabled(False)
+        self.load_song_button.setEnabled(False)
+        self.insert_event_button.setEnabled(False)
+        self.set_delay_button.setEnabled(False)
+        self.calc_delay_button.setEnabled(False)
+        self.twitch_connect_button.setEnabled(False)
+        self.action_new_lp.setEnabled(False)
+        self.action_open_lp.setEnabled(False)
+        self.action_save_lp.setEnabled(False)
+        self.action_settings.setEnabled(False)
+        self.action_help_about.setEnabled(False)
+        self.action_help_oauth.setEnabled(False)
+        self.action_help_docs.setEnabled(False)
+        self.action_help_checkcmds.setEnabled(False)
+        self.event_table_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        if(prepared is not None):
+            # Parsed (and compiled, see below) in the background already
+            lp = prepared.lightplan
+        else:
+            lp = self.lightplan_gui_to_dict()
+        self.control_lp_progressbar.setValue(0)
+        scheduler_mode = SchedulerMode.get(self.settings.value("LightPlanStudio/Scheduler", SchedulerMode.DEADLINE.name))
+        outbound = None
+        direct_send = valueToBool(self.settings.value("LightPlanStudio/DirectSend", True))
+        if(direct_send and self.twitch is not None and not rehearsal):
+            outbound = self.twitch.outbound
+            outbound.clear()
+        if(rehearsal):
+            # Cues show in the local preview, so there is no stream delay or
+            # profile latency to lead: every profile is compiled at 0ms
+            self.rehearsal_clock = AudioClock()
+            self.sync_rehearsal_clock()
+            latencies = dict.fromkeys(list(lp.get("latency_profiles", {})) + list(self.read_latency_profiles()), 0)
+            schedule = CompiledSchedule.compile(lp, 0, latencies=latencies)
+            self.lightplan_runner = LightPlanRunner(lp, 0, self.delay_adjust_ms, scheduler_mode=scheduler_mode, media_clock=self.rehearsal_clock,
+                schedule=schedule)
+            self.lightplan_runner.signals.privmsg.connect(self.rehearsal_privmsg)
+            self.rehearsal_timer.start(25)
+            self.show_rehearsal_dialog()
+            self.control_startlp_button.setEnabled(True)
+        else:
+            rate_limiter = self.create_rate_limiter(self.rate_limit_connections())
+            # Routing is resolved here, so the rate limit and chat lead only
+            # apply to the cues that really go to chat
+            sinks = self.read_output_sinks()
+            if(prepared is not None):
+                schedule = prepared.schedule_for(self.stream_delay_ms, self.read_latency_profiles(), sinks)
+            else:
+                schedule = CompiledSchedule.compile(lp, self.stream_delay_ms, latencies=self.read_latency_profiles(), sinks=sinks)
+            for name in schedule.unknown_sinks:
+                self.log(f"Output sink '{name}' isnt configured, its events go to Twitch chat", LogLevel.ERROR)
+            if(outbound is not None):
+                self.twitch.prepare(schedule)
+            report = rate_limiter.check(schedule, self.delay_adjust_ms)
+            if(not report.ok()):
+                self.log(report.summary(), LogLevel.ERROR)
+            if(rate_limiter.policy == RatePolicy.NONE):
+                rate_limiter = None
+            if(len(sinks) > 0):
+                # Events naming a sink skip chat, the rest go out as before.
+                # Without DirectSend the default is set once the runner exists
+                self.output_router = SinkRouter(outbound, sinks, self.sink_signals)
+                self.output_router.prepare(schedule)
+                outbound = self.output_router
+            chat_latency = self.twitch.chat_latency if self.twitch is not None else None
+            compensate_chat = valueToBool(self.settings.value("Twitch/CompensateChatLatency", False))
+            self.lightplan_runner = LightPlanRunner(lp, self.stream_delay_ms, self.delay_adjust_ms, scheduler_mode=scheduler_mode, outbound=outbound, seek_ms=seek_ms, schedule=schedule, rate_limiter=rate_limiter,
+                chat_latency=chat_latency, compensate_chat=compensate_chat)
+            if(self.output_router is not None and self.output_router.default is None):
+                # Chat cues go through the runner's privmsg signal, so privmsg
+                # runs on the GUI thread and not the runner's
+                self.output_router.default = CallbackSink(self.lightplan_runner.signals.privmsg.emit)
+            self.lightplan_runner.signals.privmsg.connect(self.privmsg)
+        self.lightplan_runner.signals.log.connect(self.log)
+        self.lightplan_runner.signals.done.connect(self.lightplan_runner_done)
+        self.lightplan_runner.signals.progress.connect(self.lightplan_runner_progress)
+        self.threadpool.start(self.lightplan_runner)
+        self.lightplan_start_timer.start(0.2)
+        self.lightplan_start_time = time.time()
+        if(seek_ms is not None):
+            self.lightplan_start_time -= (seek_ms - lp["starting_ms"])/1000
+        self.next_event_secs = 0
+        self.set_status("LightPlan Started", 2500)
+        self.control_startlp_button.setChecked(True)
+        self.control_startlp_button.setText("Stop LightPlan")
+
+    ## Setlist Functions ##
+
+    def setlist_add(self, path):
+        self.setlist.append(path)
+        self.log(f"Setlist: Added {path}", LogLevel.DEBUG)
+        self.preload_setlist()
+        self.update_setlist_status()
+
+    def preload_setlist(self):
+        # Parse and compile the next song in the background so starting it
+        # doesnt have to touch the disk
+        if(self.twitch is not None):
+            self.twitch.prewarm()
+        if(len(self.setlist) == 0):
+            self.setlist_next = None
+            return
+        if(self.setlist_next is not None and self.setlist_next.path == self.setlist[0]):
+            return
+        self.setlist_next = None
+        loader = LightPlanLoader(self.setlist[0], self.stream_delay_ms, self.read_latency_profiles(), self.read_output_sink_specs())
+        loader.signals.log.connect(self.log)
+        loader.signals.done.connect(self.setlist_loaded)
+        self.threadpool.start(loader)
+
+    def setlist_loaded(self, path, prepared):
+        if(len(self.setlist) == 0 or self.setlist[0] != path):
+            return
+        if(prepared is None):
+            self.setlist.pop(0)
+            self.preload_setlist()
+            self.update_setlist_status()
+            return
+        self.setlist_next = prepared
+        if(self.twitch is not None):
+            # Encode its chat lines now, so starting it only looks them up
+            self.twitch.prepare(prepared.schedule)
+        self.log(f"Setlist: Preloaded {prepared.name()} ({len(prepared.schedule)} events)", LogLevel.DEBUG)
+        self.update_setlist_status()
+
+    def update_setlist_status(self):
+        if(len(self.setlist) == 0):
+            self.set_status("Setlist Empty", 2500)
+            return
+        name = self.setlist_next.name() if self.setlist_next is not None else os.path.basename(self.setlist[0])
+        self.set_status(f"Setlist: {len(self.setlist)} queued, next: {name}")
+
+    def start_next_in_setlist(self):
+        if(len(self.setlist) == 0):
+            QMessageBox.information(self, "LightPlan Studio", "The setlist is empty. Right-click a LightPlan in the explorer to add it.")
+            return
+        if(self.lightplan_runner is not None and self.lightplan_runner.is_running()):
+            # Start the next song as soon as the current one has stopped
+            self.setlist_start_pending = True
+            self.lightplan_runner.stop()
+            return
+        if(not self.control_startlp_button.isEnabled()):
+            QMessageBox.information(self, "LightPlan Studio", "Connect to Twitch before starting a LightPlan.")
+            return
+        path = self.setlist.pop(0)
+        prepared = self.setlist_next
+        self.setlist_next = None
+        if(prepared is None or prepared.path != path):
+            try:
+                prepared = PreparedLightPlan.load(path, self.stream_delay_ms, self.read_latency_profiles(), self.read_output_sink_specs())
+            except (OSError, ValueError) as err:
+                self.log(f"Could not load LightPlan {path}", LogLevel.ERROR)
+                self.log(str(err), LogLevel.DEBUG)
+                self.preload_setlist()
+                return
+        self.log(f"Setlist: Starting {prepared.name()}")
+        self.start_lightplan(prepared=prepared)
+        # Fill in the editor once the runner is already going
+        self.stash_unsaved_lightplan()
+        self.show_lightplan(prepared.lightplan, prepared.path)
+        self.preload_setlist()
+        self.update_setlist_status()
+
+    def click_rehearse_lightplan(self):
+        if(self.lightplan_runner is not None and self.lightplan_runner.is_running()):
+            if(self.rehearsal_clock is not None):
+                self.lightplan_runner.stop()
+            return
+        if(not self.song_loaded):
+            QMessageBox.information(self, "LightPlan Studio", "Load the song in the Event Wizard to rehearse this LightPlan.")
+            return
+        self.log("LightPlan Rehearsal Started")
+        self.start_lightplan(rehearsal=True)
+        if(self.audio_player.playbackState() != QMediaPlayer.PlayingState):
+            self.audio_player.play()
+
+    def sync_rehearsal_clock(self):
+        if(self.rehearsal_clock is None):
+            return
+        playing = self.audio_player.playbackState() == QMediaPlayer.PlayingState
+        self.rehearsal_clock.sync(self.audio_player.position(), playing)
+        if(self.rehearsal_dialog is not None and self.rehearsal_clock.reports % 40 == 0):
+            self.rehearsal_dialog.set_status(self.rehearsal_clock.summary())
+
+    def show_rehearsal_dialog(self):
+        if(self.rehearsal_dialog is None):
+            self.rehearsal_dialog = RehearsalDialog(self)
+        self.rehearsal_dialog.clear()
+        self.rehearsal_dialog.show()
+
+    def rehearsal_privmsg(self, msg, index=-1):
+        position_ms = self.rehearsal_clock.position_ms() if self.rehearsal_clock else 0
+        if(self.rehearsal_dialog is not None):
+            self.rehearsal_dialog.add_cue(msToStr(position_ms, True), msg)
+        if(index >= 0 and self.lightplan_runner is not None):
+            self.lightplan_runner.telemetry.mark_sent(index)
+
+    def read_latency_profiles(self):
+        # Measured latency in ms per profile name for this rig, overriding
+        # the values saved in the LightPlans
+        latencies = {}
+        self.settings.beginGroup("LatencyProfiles")
+        for name in self.settings.childKeys():
+            try:
+                latencies[name] = int(self.settings.value(name))
+            except (TypeError, ValueError):
+                self.log(f"Invalid latency for profile {name}", LogLevel.ERROR)
+        self.settings.endGroup()
+        return latencies
+
+    def read_output_sink_specs(self):
+        # OutputSinks settings array of Name/Url, see LightPlanSinks
+        specs = {}
+        size = self.settings.beginReadArray("OutputSinks")
+        for x in range(size):
+            self.settings.setArrayIndex(x)
+            name = self.settings.value("Name", "").strip()
+            url = self.settings.value("Url", "").strip()
+            if(name and url):
+                specs[name] = url
+        self.settings.endArray()
+        return specs
+
+    def read_output_sinks(self):
+        try:
+            return create_sinks(self.read_output_sink_specs(), self.sink_signals, int(self.settings.value("Twitch/StaleCueMs", 2000)))
+        except ValueError as err:
+            self.log(str(err), LogLevel.ERROR)
+            return {}
+
+    def create_rate_limiter(self, connections=1):
+        # Twitch allows 20 messages per 30 seconds for regular users and 100
+        # for mods, per account. A pool sends as many times that as
+        # rate_limit_connections, its members enforce their own share
+        capacity = int(self.settings.value("Twitch/RateLimit", 20)) * connections
+        window_ms = int(float(self.settings.value("Twitch/RateWindow", 30)) * 1000)
+        policy = RatePolicy.get(self.settings.value("Twitch/RatePolicy", RatePolicy.NONE.name))
+        return RateLimiter(capacity, window_ms, policy)
+
+    def show_rate_limit_check(self):
+        lp = self.lightplan_gui_to_dict()
+        schedule = CompiledSchedule.compile(lp, self.stream_delay_ms, latencies=self.read_latency_profiles(), sinks=self.read_output_sink_specs())
+        report = self.create_rate_limiter(self.rate_limit_connections()).check(schedule, self.delay_adjust_ms)
+        details = "\n".join(report.details(15))
+        if(details):
+            QMessageBox.warning(self, "LightPlan Studio", f"{report.summary()}\n\n{details}")
+        else:
+            QMessageBox.information(self, "LightPlan Studio", report.summary())
+
+    def click_seek_lightplan(self):
+        running = self.lightplan_runner is not None and self.lightplan_runner.is_running()
+        if(not running and not self.control_startlp_button.isEnabled()):
+            QMessageBox.information(self, "LightPlan Studio", "Connect to Twitch before starting a LightPlan.")
+            return
+        position_ms = strToMs(self.start_event_edit.text().strip())
+        if(running):
+            position_ms = self.lightplan_runner.start_ms + int((time.time()-self.lightplan_start_time)*1000)
+        text, ok = QInputDialog.getText(self, "Seek LightPlan", "Song Position (mm:ss.zzz):", text=msToStr(position_ms, True))
+        if(not ok or len(text.strip()) == 0):
+            return
+        seek_ms = strToMs(text.strip())
+        self.log(f"LightPlan Seek: {msToStr(seek_ms, True)}")
+        if(running and self.rehearsal_clock is not None):
+            # Rehearsals follow the audio, so move the player instead
+            self.audio_player.setPosition(seek_ms)
+        elif(running):
+            self.lightplan_runner.seek(seek_ms)
+            self.lightplan_start_time = time.time() - (seek_ms - self.lightplan_runner.start_ms)/1000
+        else:
+            self.start_lightplan(seek_ms)
+
     def lightplan_runner_done(self, msg="LightPlan Stopped"):
         self.lp_songtitle_edit.setEnabled(True)
         self.lp_artist_edit.setEnabled(True)
@@ -896,6 +1203,66 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         self.control_startlp_button.setChecked(False)
         self.control_startlp_button.setText("Start LightPlan")
         self.set_status(msg, 2500)
+        self.write_timing_report()
+        if(self.output_router is not None):
+            self.output_router.close()
+            self.output_router = None
+        if(self.rehearsal_clock is not None):
+            self.rehearsal_timer.stop()
+            self.log(self.rehearsal_clock.summary())
+            if(self.rehearsal_dialog is not None):
+                self.rehearsal_dialog.set_status(self.rehearsal_clock.summary())
+            self.rehearsal_clock = None
+            self.control_startlp_button.setEnabled(self.twitch is not None and self.twitch.connected())
+        if(self.twitch is not None):
+            for line in self.twitch.summary_lines():
+                self.log(line, LogLevel.DEBUG)
+            self.twitch.prewarm()
+        if(self.setlist_start_pending):
+            self.setlist_start_pending = False
+            self.start_next_in_setlist()
+        elif(len(self.unsaved_lightplans) > 0):
+            self.offer_unsaved_lightplans()
+
+    def write_timing_report(self):
+        if(self.lightplan_runner is None):
+            return
+        if(not valueToBool(self.settings.value("LightPlanStudio/TimingReports", True))):
+            return
+        telemetry = self.lightplan_runner.telemetry
+        if(len(telemetry.scheduled_ms) == 0):
+            return
+        lp = self.lightplan_runner.lightplan_dict
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        basename = os.path.splitext(self.get_lp_basename(lp["song_artist"], lp["song_title"]))[0]
+        extra = {
+            "song_artist": lp["song_artist"],
+            "song_title": lp["song_title"],
+            "started": timestamp,
+            "stream_delay_ms": self.lightplan_runner.stream_delay_ms,
+            "runtime_adjust_ms": self.lightplan_runner.runtime_adjust_ms,
+            "scheduler": type(self.lightplan_runner.scheduler).__name__,
+            "rehearsal": self.rehearsal_clock is not None,
+            "cpu_ms": self.lightplan_runner.stats.cpu_ms(),
+            "cpu_percent": self.lightplan_runner.stats.cpu_percent()
+        }
+        try:
+            json_path, csv_path = telemetry.write_report(self.report_dir, f"{timestamp} {basename}".strip(), extra)
+        except OSError as err:
+            self.log("Could not write timing report", LogLevel.ERROR)
+            self.log(str(err), LogLevel.DEBUG)
+            return
+        summary = telemetry.summary()
+        if(summary["fired"] > 0):
+            err = summary["error_ms"]
+            self.log(f"Firing error p50 {err['p50']:+.2f}ms p99 {err['p99']:+.2f}ms max {err['max']:+.2f}ms")
+        if(summary["sent"] > 0):
+            lat = summary["send_latency_ms"]
+            self.log(f"Send latency p50 {lat['p50']:.2f}ms p99 {lat['p99']:.2f}ms max {lat['max']:.2f}ms")
+        if(summary["queue_latency_ms"]["count"] > 0):
+            lat = summary["queue_latency_ms"]
+            self.log(f"Queue to write p50 {lat['p50']:.3f}ms p99 {lat['p99']:.3f}ms max {lat['max']:.3f}ms", LogLevel.DEBUG)
+        self.log(f"Timing Report: {json_path}", LogLevel.DEBUG)
 
     def lightplan_runner_progress(self, cur_evt_num, next_event_secs, next_event, original_index):
         self.next_event_secs = next_event_secs
@@ -916,9 +1283,11 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
 
     ## Twitch Chat Functions ##
 
-    def privmsg(self, msg):
-        if(self.twitch and self.twitch.connected()):
-            self.twitch.privmsg(msg)
+    def privmsg(self, msg, index=-1):
+        if(self.twitch):
+            # Queued while the connection is being re-established
+            telemetry = self.lightplan_runner.telemetry if index >= 0 and self.lightplan_runner is not None else None
+            self.twitch.privmsg(msg, index, telemetry)
 
     def click_twitch_connect_button(self):
         if(self.twitch and self.twitch.connected()):
@@ -930,11 +1299,19 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
             user_name = self.settings.value("Twitch/Username", "")
             token = self.settings.value("Twitch/OAuthToken", "")
             channel = self.settings.value("Twitch/Channel", "")
-            self.twitch = TwitchIRC(user_name, token, channel)
+            use_tls = valueToBool(self.settings.value("Twitch/UseTLS", False))
+            port = int(self.settings.value("Twitch/Port", 6697 if use_tls else 6667))
+            stale_ms = int(self.settings.value("Twitch/StaleCueMs", 2000))
+            rate_limiter = self.create_rate_limiter()
+            pool_mode = PoolMode.get(self.settings.value("Twitch/PoolMode", PoolMode.CHANNEL.name))
+            self.twitch = TwitchIRC(user_name, token, channel, port=port, use_tls=use_tls, stale_ms=stale_ms,
+                accounts=self.read_pool_accounts(), pool_mode=pool_mode, rate_limit=rate_limiter.capacity, rate_window_ms=rate_limiter.window_ms,
+                probe=valueToBool(self.settings.value("Twitch/LatencyProbe", True)))
             self.twitch.signals.log.connect(self.log)
             self.twitch.signals.irc_disconnect.connect(self.twitch_disconnect)
             self.twitch.signals.irc_connect.connect(self.twitch_connect)
             self.twitch.signals.connect_failed.connect(self.twitch_connect_failed)
+            self.twitch.signals.reconnecting.connect(self.twitch_reconnecting)
             self.threadpool.start(self.twitch)
             self.twitch_connect_button.setChecked(True)
             self.check_start_ssl_connection()
@@ -953,6 +1330,37 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
         self.twitch_connect_button.setChecked(False)
         self.connected_label.setHidden(True)
 
+    def rate_limit_connections(self):
+        # A connected pool knows its members, otherwise go by the settings
+        if(self.twitch is not None):
+            return self.twitch.rate_multiplier()
+        accounts = self.read_pool_accounts()
+        if(len(accounts) == 0):
+            return 1
+        channels = [self.settings.value("Twitch/Channel", "")] + [account[2] for account in accounts]
+        return pool_rate_multiplier(channels, PoolMode.get(self.settings.value("Twitch/PoolMode", PoolMode.CHANNEL.name)))
+
+    def read_pool_accounts(self):
+        # Extra bot accounts and channels for the connection pool, stored as
+        # a TwitchPool settings array of Username/OAuthToken/Channel
+        accounts = []
+        size = self.settings.beginReadArray("TwitchPool")
+        for x in range(size):
+            self.settings.setArrayIndex(x)
+            user_name = self.settings.value("Username", "")
+            token = self.settings.value("OAuthToken", "")
+            channel = self.settings.value("Channel", "")
+            if(user_name and token and channel):
+                accounts.append((user_name, token.replace("oauth:", ""), channel))
+        self.settings.endArray()
+        return accounts
+
+    def twitch_reconnecting(self, delay):
+        # Cues keep queueing while the connection comes back, so a running
+        # LightPlan is left alone
+        self.connected_label.setHidden(True)
+        self.set_status(f"Twitch connection lost, reconnecting in {delay:g}s", 5000)
+
     def twitch_connect_failed(self):
         choice = QMessageBox.warning(self, 
             "LightPlan Studio", 
@@ -1252,6 +1660,8 @@ class LightPlanStudio(QMainWindow, UI.Ui_LPS_MainWindow):
             self.twitch.die()
         if(self.lightplan_runner is not None and self.lightplan_runner.is_running()):
             self.lightplan_runner.stop()
+        if(self.lp_scanner is not None):
+            self.lp_scanner.stop()
         if(self.streamer_song_list.connected()):
             self.streamer_song_list.disconnect()
         # Save Window Geometry
@@ -1300,6 +1710,29 @@ class LoadingDialog(QDialog):
         self.ui.loading_label.setMovie(movie)
         self.movie.start()
 
+class RehearsalDialog(QDialog):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("LightPlan Rehearsal")
+        self.resize(320, 400)
+        self.status_label = QLabel("Waiting for audio...", self)
+        self.status_label.setWordWrap(True)
+        self.cue_list = QListWidget(self)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.cue_list)
+
+    def clear(self):
+        self.cue_list.clear()
+
+    def add_cue(self, position_str, msg):
+        self.cue_list.addItem(f"{position_str}  {msg}")
+        self.cue_list.scrollToBottom()
+
+    def set_status(self, msg):
+        self.status_label.setText(msg)
+
 class SSLMatchDialog(QDialog):
     
     class RowObj(QTableWidgetItem):
@@ -1462,6 +1895,10 @@ class CalcDelayDialog(QDialog):
         self.timer.stop()
         self.timer_update()
         self.delay = round(self.elapsed*1000)
+        # The measured chat path is part of what was just timed by hand
+        if(self.twitch is not None and self.twitch.chat_latency.count > 0):
+            self.setWindowTitle(f"Calculate Delay - chat path ~{self.twitch.chat_latency.uplink_ms():.0f}ms")
+            self.log(self.twitch.chat_latency.summary())
         self.ui.send_button.setEnabled(True)
         self.ui.stop_button.setEnabled(False)
         self.ui.save_button.setEnabled(True)
@@ -1622,6 +2059,9 @@ def strToMs(offset_str):
     return (mins * 60 * 1000) + int(secs * 1000)
 
 if __name__ == "__main__":
+    # The bulk importer parses in a process pool, which a frozen build only
+    # supports with this
+    multiprocessing.freeze_support()
     version = "1.0.0"
     app_name = "LightPlanStudio"
     org_name = "ChillAspect"
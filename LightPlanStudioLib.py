@@ -1,5 +1,8 @@
 #Python Imports
+import os
 import time
+import json
+import hashlib
 import keyboard
 import requests
 import sqlite3
@@ -8,27 +11,17 @@ from enum import Enum, auto
 #PySide6 Imports
 from PySide6.QtCore import QRunnable, Signal, Slot, QObject, Qt, QAbstractTableModel, QEvent
 from PySide6.QtWidgets import QLineEdit, QCheckBox, QComboBox, QMenu, QStyledItemDelegate, QStyle, QPushButton
-from PySide6.QtGui import QAction, QCursor, QStandardItemModel
+from PySide6.QtGui import QAction, QCursor, QStandardItemModel, QStandardItem
 
 #LightPlan Imports
-import irc.client
+from LightPlanCore import LogLevel, SchedulerMode, AudioClock, LightPlanPlayer, PreparedLightPlan, CompiledSchedule, RatePolicy, RateLimiter, \
+    parse_lightplans
+from LightPlanIRC import TwitchChat, TwitchPool, PoolMode, pool_rate_multiplier
+from LightPlanSinks import SinkRouter, CallbackSink, create_sinks
 from twitchio.ext import commands
 from pytube import YouTube
 import socketio
 
-#Log Levels
-class LogLevel(Enum):
-    INFO = 0
-    ERROR = 10
-    DEBUG = 20
-    
-    @staticmethod
-    def get(value):
-        for level in LogLevel:
-            if(value == level.value):
-                return level
-        return LogLevel.INFO
-
 class OperatingSystem(Enum):
     WINDOWS = auto()
     MAC = auto()
@@ -40,6 +33,87 @@ class LightPlanDB():
     class Signals(QObject):
         log = Signal(str, LogLevel)
 
+    # Schema migrations, applied in order. The database's PRAGMA user_version
+    # is the number of migrations it already has. Only ever append here.
+    MIGRATIONS = [
+        # 1: the original schema (databases from before user_version already
+        # have these tables, hence IF NOT EXISTS)
+        """CREATE TABLE IF NOT EXISTS folders (
+            folder_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            parent_id INTEGER DEFAULT 0,
+            name TEXT
+        );
+        CREATE TABLE IF NOT EXISTS lightplans (
+            lightplan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            folder_id INTEGER,
+            title TEXT,
+            artist TEXT,
+            author TEXT,
+            ssl_id INTEGER,
+            spotify_id INTEGER,
+            video_url TEXT,
+            notes TEXT,
+            starting_ms INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lightplan_id INTEGER,
+            offset INTEGER,
+            command TEXT,
+            comment TEXT,
+            ignore_delay INTEGER,
+            FOREIGN KEY (lightplan_id)
+                REFERENCES lightplans (lightplan_id)
+                    ON DELETE CASCADE
+                    ON UPDATE NO ACTION
+        );
+        INSERT INTO folders (name) SELECT 'LiveLearn' WHERE NOT EXISTS (SELECT 1 FROM folders);""",
+        # 2: indexes for the events of a plan, duplicate checks and SSL lookups
+        """CREATE INDEX IF NOT EXISTS events_lightplan_id ON events (lightplan_id, event_id);
+        CREATE INDEX IF NOT EXISTS lightplans_artist_title ON lightplans (artist, title);
+        CREATE INDEX IF NOT EXISTS lightplans_ssl_id ON lightplans (ssl_id);""",
+        # 3: full text search, one row per plan keyed by lightplan_id. events
+        # holds the command and comment text of all its events.
+        """CREATE VIRTUAL TABLE IF NOT EXISTS lightplan_search USING fts5 (
+            title, artist, author, notes, events,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS lightplans_search_delete AFTER DELETE ON lightplans BEGIN
+            DELETE FROM lightplan_search WHERE rowid = old.lightplan_id;
+        END;
+        INSERT INTO lightplan_search (rowid, title, artist, author, notes, events)
+            SELECT lightplan_id, title, artist, author, notes, '' FROM lightplans;
+        UPDATE lightplan_search SET events = (
+            SELECT group_concat(coalesce(command, '') || ' ' || coalesce(comment, ''), ' ')
+            FROM events WHERE events.lightplan_id = lightplan_search.rowid);""",
+        # 4: header cache for the .plan files in the LightPlan directory, so
+        # the explorer only parses files that changed since the last scan.
+        # valid is 0 for files that arent LightPlans.
+        """CREATE TABLE IF NOT EXISTS plan_files (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime_ns INTEGER,
+            hash TEXT,
+            valid INTEGER,
+            artist TEXT,
+            title TEXT,
+            ssl_id
+        ) WITHOUT ROWID;""",
+        # 5: full text search over the plan_files headers, so the search box
+        # also finds the plans shown in the explorer. Rebuilt from plan_files
+        # whenever a scan changes it.
+        """CREATE VIRTUAL TABLE IF NOT EXISTS plan_file_search USING fts5 (
+            path UNINDEXED, title, artist,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+        INSERT INTO plan_file_search (path, title, artist)
+            SELECT path, title, artist FROM plan_files WHERE valid = 1;""",
+    ]
+
+    SEARCH_LIMIT = 200
+    SCAN_BATCH = 500
+    SCAN_BATCH_SECS = 0.1
+
     def __init__(self, path):
         self.path = path
         self.signals = self.Signals()
@@ -51,154 +125,392 @@ class LightPlanDB():
         self.init_db()
 
     def init_db(self):
-        #Initialize the DB if its empty (on first run)
+        # WAL lets the importer write while the GUI reads, and with WAL
+        # synchronous=NORMAL is still safe against corruption on power loss.
+        # Negative cache_size is in KiB.
         cursor = self.connection.cursor()
-        lp_table = cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='lightplans';").fetchall()
-        folder_table = cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='folders';").fetchall()
-        event_table = cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='events';").fetchall()
-        if len(lp_table) == 0  or len(folder_table) == 0 or len(event_table) == 0:
-            sql = """CREATE TABLE IF NOT EXISTS folders (
-                folder_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                parent_id INTEGER DEFAULT 0,
-                name TEXT
-            );
-            """
-            try:
-                cursor.execute(sql)
-            except Exception as e:
-                self.log(str(e), LogLevel.ERROR)
-            sql = """CREATE TABLE IF NOT EXISTS lightplans (
-                lightplan_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                folder_id INTEGER,
-                title TEXT,
-                artist TEXT,
-                author TEXT,
-                ssl_id INTEGER,
-                spotify_id INTEGER,
-                video_url TEXT,
-                notes TEXT,
-                starting_ms INTEGER
-            );
-            """
-            try:
-                cursor.execute(sql)
-            except Exception as e:
-                self.log(str(e), LogLevel.ERROR)
-            sql = """CREATE TABLE IF NOT EXISTS events (
-                event_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                lightplan_id INTEGER,
-                offset INTEGER,
-                command TEXT,
-                comment TEXT,
-                ignore_delay INTEGER,
-                FOREIGN KEY (lightplan_id) 
-                    REFERENCES lightplans (lightplan_id) 
-                        ON DELETE CASCADE 
-                        ON UPDATE NO ACTION
-            );
-            """
+        try:
+            cursor.execute("PRAGMA journal_mode = WAL;")
+            cursor.execute("PRAGMA synchronous = NORMAL;")
+            cursor.execute("PRAGMA cache_size = -16000;")
+            cursor.execute("PRAGMA temp_store = MEMORY;")
+        except sqlite3.Error as e:
+            self.log(str(e), LogLevel.ERROR)
+        self.migrate()
+
+    def schema_version(self):
+        return self.connection.execute("PRAGMA user_version;").fetchone()[0]
+
+    def migrate(self):
+        version = self.schema_version()
+        for number in range(version + 1, len(self.MIGRATIONS) + 1):
+            self.log(f"Migrating LightPlan Database to version {number}", LogLevel.DEBUG)
             try:
-                cursor.execute(sql)
-            except Exception as e:
-                self.log(str(e), LogLevel.ERROR)
-            cursor.execute("INSERT INTO folders (name) VALUES ('LiveLearn')")
+                # executescript commits anything pending first; the migration
+                # and its version bump then go in as one transaction
+                self.connection.executescript(f"BEGIN; {self.MIGRATIONS[number - 1]} PRAGMA user_version = {number}; COMMIT;")
+            except sqlite3.Error as e:
+                if(self.connection.in_transaction):
+                    self.connection.rollback()
+                self.log(f"LightPlan Database migration {number} failed: {e}", LogLevel.ERROR)
+                return False
+        return True
 
     def fetch_all_lightplans(self):
-        lps = []
-        cursor = self.connection.cursor()
-
-        sql = "SELECT * FROM lightplans;"
         try:
-            lps_rows = cursor.execute(sql).fetchall()
-        except Exception as e:
+            return list(self.iter_lightplans())
+        except sqlite3.Error as e:
             self.log(str(e), LogLevel.ERROR)
             return None
-        for lp in lps_rows:
-            lightplan_dict = {
-                "song_title": lp[2],
-                "song_artist": lp[3],
-                "author": lp[4],
-                "ssl_id": lp[5],
-                "spotify_id": lp[6],
-                "video_url": lp[7],
-                "notes": lp[8],
-                "starting_ms": lp[9],
-                "events": []
-            }
-            sql = f"SELECT * FROM events WHERE lightplan_id = {lp[0]};"
-            rows = cursor.execute(sql).fetchall()
-            for row in rows:
-                ignore_delay = False
-                if row[5]:
-                    ignore_delay = True
-                event_dict = {
-                    "offset": row[2],
-                    "command": row[3],
-                    "comment": row[4],
-                    "ignore_delay": ignore_delay
-                }
-                lightplan_dict["events"].append(event_dict)
-            lps.append(lightplan_dict)                
-        return lps
 
-    def import_lightplan(self, lp_dict):
-        self.log(f"Importing LightPlan {lp_dict['song_artist']} - {lp_dict['song_title']}", LogLevel.INFO)
+    def iter_lightplans(self):
+        # One ordered LEFT JOIN streamed from the cursor; rows are grouped into
+        # plans as they arrive so only one plan is held in memory at a time
+        sql = """SELECT l.lightplan_id, l.title, l.artist, l.author, l.ssl_id, l.spotify_id, l.video_url, l.notes, l.starting_ms,
+                e.event_id, e.offset, e.command, e.comment, e.ignore_delay
+            FROM lightplans l
+            LEFT JOIN events e ON e.lightplan_id = l.lightplan_id
+            ORDER BY l.lightplan_id, e.event_id;"""
         cursor = self.connection.cursor()
-        sql = f"SELECT count(lightplan_id) FROM lightplans WHERE artist = '{lp_dict['song_artist']}' AND title = '{lp_dict['song_title']}';"
-        result = cursor.execute(sql).fetchone()
-        if result and result[0] > 0:
-            self.log(str(result), LogLevel.DEBUG)
-            self.log("This lightplan already exists!", LogLevel.INFO)
-            return
-        
+        lightplan_dict = None
+        current_id = None
+        for row in cursor.execute(sql):
+            if(row[0] != current_id):
+                if(lightplan_dict is not None):
+                    yield lightplan_dict
+                current_id = row[0]
+                lightplan_dict = {
+                    "song_title": row[1],
+                    "song_artist": row[2],
+                    "author": row[3],
+                    "ssl_id": row[4],
+                    "spotify_id": row[5],
+                    "video_url": row[6],
+                    "notes": row[7],
+                    "starting_ms": row[8],
+                    "events": []
+                }
+            if(row[9] is not None):
+                lightplan_dict["events"].append({
+                    "offset": row[10],
+                    "command": row[11],
+                    "comment": row[12],
+                    "ignore_delay": bool(row[13])
+                })
+        if(lightplan_dict is not None):
+            yield lightplan_dict
+
+    def fetch_lightplan(self, lightplan_id):
+        # A plan in the .plan file format, ready for show_lightplan
+        row = self.connection.execute("""SELECT title, artist, author, ssl_id, spotify_id, video_url, notes, starting_ms
+            FROM lightplans WHERE lightplan_id = ?;""", (lightplan_id,)).fetchone()
+        if(row is None):
+            return None
+        events = self.connection.execute("""SELECT offset, command, comment, ignore_delay FROM events
+            WHERE lightplan_id = ? ORDER BY event_id;""", (lightplan_id,)).fetchall()
+        return {
+            "song_title": row[0] or "",
+            "song_artist": row[1] or "",
+            "author": row[2] or "",
+            "ssl_id": row[3] or 0,
+            "spotify_id": row[4] or 0,
+            "youtube_url": row[5] or "",
+            "notes": row[6] or "",
+            "starting_ms": row[7] or 0,
+            "events": [{"offset": evt[0], "command": evt[1], "comment": evt[2] or "", "ignore_delay": bool(evt[3])} for evt in events]
+        }
+
+    @staticmethod
+    def search_query(text):
+        # Every word has to match, as a prefix so results show up while
+        # typing. Words are quoted so FTS5 operators in the input are literal.
+        words = []
+        for word in text.split():
+            word = word.replace('"', '""')
+            words.append(f'"{word}"*')
+        return " ".join(words)
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        # [(lightplan_id, artist, title)] best matches first; title and
+        # artist hits outrank notes and event text
+        query = self.search_query(text)
+        if(len(query) == 0):
+            return []
+        sql = """SELECT rowid, artist, title FROM lightplan_search
+            WHERE lightplan_search MATCH ?
+            ORDER BY bm25(lightplan_search, 10.0, 10.0, 2.0, 1.0, 1.0)
+            LIMIT ?;"""
         try:
-            lp_dict["ssl_id"] = int(lp_dict["ssl_id"])
-        except ValueError:
-            lp_dict["ssl_id"] = "NULL"
-        
+            return self.connection.execute(sql, (query, limit)).fetchall()
+        except sqlite3.Error as e:
+            self.log(str(e), LogLevel.ERROR)
+            return []
+
+    def search_files(self, text, limit=SEARCH_LIMIT):
+        # [(path, artist, title)] of the .plan files in the LightPlan
+        # directory, matched on title and artist only
+        query = self.search_query(text)
+        if(len(query) == 0):
+            return []
+        sql = """SELECT path, artist, title FROM plan_file_search
+            WHERE plan_file_search MATCH ?
+            ORDER BY rank
+            LIMIT ?;"""
         try:
-            lp_dict["spotify_id"] = int(lp_dict["spotify_id"])
-        except ValueError:
-            lp_dict["spotify_id"] = "NULL"
+            return self.connection.execute(sql, (query, limit)).fetchall()
+        except sqlite3.Error as e:
+            self.log(str(e), LogLevel.ERROR)
+            return []
+
+    def scan_plan_files(self, root):
+        # Headers ({path, artist, title, ssl_id}) of the LightPlans under root,
+        # sorted by path
+        plans = []
+        for batch in self.iter_plan_files(root):
+            plans.extend(batch)
+        plans.sort(key=lambda lp: os.path.normcase(lp["path"]).split("/"))
+        return plans
+
+    def iter_plan_files(self, root, dirs=None, stopped=None):
+        # The same headers in batches, directory by directory, so a large or
+        # network mounted library can be shown while it is still being read.
+        # A batch is yielded every SCAN_BATCH plans or SCAN_BATCH_SECS,
+        # whichever comes first. Files whose size and mtime match the index
+        # are not opened; changed files are hashed first so a touched but
+        # identical file isnt parsed again. The index is updated once the
+        # whole tree has been read, unless stopped() returned True.
+        # Directories found on the way are added to dirs.
+        start = time.perf_counter()
+        cached = {}
+        for row in self.connection.execute("SELECT path, size, mtime_ns, hash, valid, artist, title, ssl_id FROM plan_files;"):
+            cached[row[0]] = row
+        batch = []
+        batch_start = time.perf_counter()
+        count = 0
+        updates = []
+        parsed = 0
+        for path, stat in self.walk_plan_files(root, dirs):
+            if(stopped is not None and stopped()):
+                return
+            row = cached.pop(path, None)
+            if(row is None or row[1] != stat.st_size or row[2] != stat.st_mtime_ns):
+                try:
+                    with open(path, "rb") as file:
+                        data = file.read()
+                except OSError as err:
+                    self.log(repr(err), LogLevel.ERROR)
+                    continue
+                digest = hashlib.md5(data).hexdigest()
+                if(row is None or row[3] != digest):
+                    row = self.parse_plan_header(path, data, digest, stat)
+                    parsed += 1
+                else:
+                    row = (path, stat.st_size, stat.st_mtime_ns) + row[3:]
+                updates.append(row)
+            if(row[4]):
+                batch.append({"path": path, "artist": row[5], "title": row[6], "ssl_id": row[7]})
+            if(len(batch) >= self.SCAN_BATCH or (batch and time.perf_counter() - batch_start >= self.SCAN_BATCH_SECS)):
+                count += len(batch)
+                yield batch
+                batch = []
+                batch_start = time.perf_counter()
+        count += len(batch)
+        if(batch):
+            yield batch
+        try:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO plan_files VALUES (?,?,?,?,?,?,?,?);", updates)
+                self.connection.executemany("DELETE FROM plan_files WHERE path = ?;", [(path,) for path in cached])
+                if(updates or cached):
+                    # Cheap next to the scan itself, and only done when it changed something
+                    self.connection.execute("DELETE FROM plan_file_search;")
+                    self.connection.execute("""INSERT INTO plan_file_search (path, title, artist)
+                        SELECT path, title, artist FROM plan_files WHERE valid = 1;""")
+        except sqlite3.Error as e:
+            self.log(str(e), LogLevel.ERROR)
+        self.log(f"Scanned {count} LightPlans ({parsed} parsed, {len(cached)} removed) in {(time.perf_counter() - start)*1000:.0f}ms", LogLevel.DEBUG)
 
+    @staticmethod
+    def walk_plan_files(root, dirs=None):
+        # (path, stat) of every .plan under root, one directory at a time.
+        # scandir instead of Path.rglob: it returns the file type with the
+        # name, and on a big library sorting Path objects cost more than
+        # reading the directories.
+        pending = [root]
+        while pending:
+            files = []
+            subdirs = []
+            try:
+                entries = list(os.scandir(pending.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if(entry.is_dir()):
+                        subdirs.append(entry.path.replace("\\", "/"))
+                    elif(entry.name.endswith(".plan") and entry.is_file()):
+                        files.append((entry.path.replace("\\", "/"), entry.stat()))
+                except OSError:
+                    continue
+            files.sort(key=lambda file: os.path.normcase(file[0]))
+            yield from files
+            subdirs.sort(key=os.path.normcase, reverse=True)
+            pending.extend(subdirs)
+            if(dirs is not None):
+                dirs.extend(subdirs)
+
+    def parse_plan_header(self, path, data, digest, stat):
         try:
-            lp_dict["starting_ms"] = int(lp_dict["starting_ms"])
-        except ValueError:
-            lp_dict["starting_ms"] = "NULL"
-
-        sql = f"""INSERT INTO lightplans (title, artist, author, ssl_id, spotify_id, video_url,  notes, starting_ms) 
-            VALUES (
-                '{lp_dict['song_title']}',
-                '{lp_dict['song_artist']}',
-                '{lp_dict['author']}',
-                {lp_dict['ssl_id']},
-                {lp_dict['spotify_id']},
-                '{lp_dict['youtube_url']}',
-                '{lp_dict['notes']}',
-                {lp_dict['starting_ms']}
-            );
-        """
+            lightplan = json.loads(data)
+            if(not isinstance(lightplan, dict) or "song_artist" not in lightplan or "song_title" not in lightplan):
+                return (path, stat.st_size, stat.st_mtime_ns, digest, 0, None, None, None)
+        except ValueError as err:
+            self.log(repr(err), LogLevel.ERROR)
+            return (path, stat.st_size, stat.st_mtime_ns, digest, 0, None, None, None)
+        return (path, stat.st_size, stat.st_mtime_ns, digest, 1, lightplan["song_artist"], lightplan["song_title"], lightplan.get("ssl_id", 0))
+
+    def count_lightplans(self):
+        return self.connection.execute("SELECT count(*) FROM lightplans;").fetchone()[0]
+
+    def import_lightplan(self, lp_dict):
+        self.log(f"Importing LightPlan {lp_dict['song_artist']} - {lp_dict['song_title']}", LogLevel.INFO)
+        report = self.import_lightplans([("", lp_dict)])
+        if(report.duplicates):
+            self.log("This lightplan already exists!", LogLevel.INFO)
+        for path, error in report.errors:
+            self.log("Could not import LightPlan")
+            self.log(error, LogLevel.ERROR)
+
+    @staticmethod
+    def to_int(value):
         try:
-            result = cursor.execute(sql)
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def import_lightplans(self, lightplans):
+        # Bulk import of (path, lightplan dict) pairs in one transaction.
+        # Plans already in the database (same artist and title) are skipped.
+        report = ImportReport()
+        known = set(self.connection.execute("SELECT artist, title FROM lightplans;").fetchall())
+        paths = []
+        headers = []
+        plans = []
+        for path, lp_dict in lightplans:
+            try:
+                key = (lp_dict["song_artist"], lp_dict["song_title"])
+                header = (lp_dict["song_title"], lp_dict["song_artist"], lp_dict.get("author"),
+                    self.to_int(lp_dict.get("ssl_id")), self.to_int(lp_dict.get("spotify_id")),
+                    lp_dict.get("youtube_url"), lp_dict.get("notes"), self.to_int(lp_dict.get("starting_ms")))
+                events = [(evt["offset"], evt["command"], evt.get("comment"), 1 if evt.get("ignore_delay") else 0)
+                    for evt in lp_dict["events"]]
+            except (KeyError, TypeError) as err:
+                report.errors.append((path, f"Not a LightPlan: missing {err}"))
+                continue
+            if(key in known):
+                report.duplicates.append(path)
+                continue
+            known.add(key)
+            paths.append(path)
+            headers.append(header)
+            plans.append(events)
+        if(len(headers) == 0):
+            return report
+
+        cursor = self.connection.cursor()
+        if(self.connection.in_transaction):
             self.connection.commit()
-            lp_id = cursor.execute(f"SELECT lightplan_id FROM lightplans WHERE rowid = {cursor.lastrowid};").fetchone()[0]
-            rows_to_insert = []
-            sql = "INSERT INTO events (lightplan_id, offset, command, comment, ignore_delay) VALUES (?,?,?,?,?);"
-            for event in lp_dict["events"]:
-                ignore_delay = 0
-                if event["ignore_delay"]:
-                    ignore_delay = 1
-                rows_to_insert.append((lp_id,event["offset"],event["command"],event["comment"],ignore_delay))
-            cursor.executemany(sql, rows_to_insert)
+        try:
+            # IMMEDIATE takes the write lock up front, so the AUTOINCREMENT ids
+            # handed out below are consecutive and follow the insert order
+            cursor.execute("BEGIN IMMEDIATE;")
+            last_id = cursor.execute("SELECT coalesce(max(seq), 0) FROM sqlite_sequence WHERE name = 'lightplans';").fetchone()[0]
+            cursor.executemany("""INSERT INTO lightplans (title, artist, author, ssl_id, spotify_id, video_url, notes, starting_ms)
+                VALUES (?,?,?,?,?,?,?,?);""", headers)
+            ids = [row[0] for row in cursor.execute(
+                "SELECT lightplan_id FROM lightplans WHERE lightplan_id > ? ORDER BY lightplan_id;", (last_id,))]
+            rows = []
+            for lp_id, events in zip(ids, plans):
+                for offset, command, comment, ignore_delay in events:
+                    rows.append((lp_id, offset, command, comment, ignore_delay))
+            cursor.executemany("INSERT INTO events (lightplan_id, offset, command, comment, ignore_delay) VALUES (?,?,?,?,?);", rows)
+            search_rows = []
+            for lp_id, header, events in zip(ids, headers, plans):
+                text = " ".join(f"{command or ''} {comment or ''}" for offset, command, comment, ignore_delay in events)
+                search_rows.append((lp_id, header[0], header[1], header[2], header[6], text))
+            cursor.executemany("INSERT INTO lightplan_search (rowid, title, artist, author, notes, events) VALUES (?,?,?,?,?,?);", search_rows)
             self.connection.commit()
-        except Exception as e:
-            self.log("Could not import LightPlan")
+        except sqlite3.Error as e:
+            self.connection.rollback()
             self.log(str(e), LogLevel.ERROR)
+            report.errors.extend((path, str(e)) for path in paths)
+            return report
+        report.imported = len(headers)
+        report.events = len(rows)
+        return report
 
     def log(self, msg, level=LogLevel.DEBUG):
         self.signals.log.emit(msg, level)
 
 
+class ImportReport():
+
+    def __init__(self):
+        self.imported = 0
+        self.events = 0
+        self.duplicates = []
+        self.errors = []
+
+    def summary(self):
+        msg = f"Imported {self.imported} LightPlans ({self.events} events)"
+        if(self.duplicates):
+            msg += f", {len(self.duplicates)} already in the database"
+        if(self.errors):
+            msg += f", {len(self.errors)} failed"
+        return msg
+
+
+class LightPlanImporter(QRunnable):
+    # Parses .plan files in a process pool and imports them into the
+    # LightPlan database on its own connection, off the GUI thread
+
+    class Signals(QObject):
+        log = Signal(str, LogLevel)
+        done = Signal(object)
+
+    def __init__(self, db_path, paths):
+        super(LightPlanImporter, self).__init__()
+        self.signals = self.Signals()
+        self.db_path = db_path
+        self.paths = list(paths)
+
+    def run(self):
+        report = ImportReport()
+        start = time.perf_counter()
+        parsed = []
+        parse_errors = []
+        for path, lp_dict, error in parse_lightplans(self.paths):
+            if(lp_dict is None):
+                parse_errors.append((path, error))
+            else:
+                parsed.append((path, lp_dict))
+        self.log(f"Parsed {len(parsed)} of {len(self.paths)} LightPlans in {(time.perf_counter() - start)*1000:.0f}ms", LogLevel.DEBUG)
+        try:
+            db = LightPlanDB(self.db_path)
+            db.signals.log.connect(self.log)
+            report = db.import_lightplans(parsed)
+            db.connection.close()
+        except sqlite3.Error as e:
+            self.log(str(e), LogLevel.ERROR)
+            report.errors.extend((path, str(e)) for path, lp_dict in parsed)
+        report.errors = parse_errors + report.errors
+        self.log(f"{report.summary()} in {(time.perf_counter() - start)*1000:.0f}ms", LogLevel.DEBUG)
+        self.signals.done.emit(report)
+
+    def log(self, msg, level=LogLevel.INFO):
+        self.signals.log.emit(msg, level)
+
+
 class SSLButton(QPushButton):
     def __init__(self, *args, **kwargs):
         self.data = {}
@@ -316,110 +628,126 @@ class LightPlanRunner(QRunnable):
         log = Signal(str, LogLevel)
         progress = Signal(int, float, str, int)
         done = Signal(str)
-        privmsg = Signal(str)
+        privmsg = Signal(str, int)
 
-    def __init__(self, lightplan_dict=None, stream_delay=0, adjust=0, start_ms=0, starting_index=0):
+    def __init__(self, lightplan_dict=None, stream_delay=0, adjust=0, start_ms=0, starting_index=0, scheduler_mode=SchedulerMode.DEADLINE, outbound=None, seek_ms=None, media_clock=None, schedule=None, rate_limiter=None, chat_latency=None, compensate_chat=False):
         super(LightPlanRunner, self).__init__()
         self.signals = self.Signals()
+        # The schedule itself runs in the Qt-free LightPlanPlayer, which
+        # reports back through these signals
+        self.player = LightPlanPlayer(lightplan_dict, stream_delay, adjust, starting_index,
+            scheduler_mode=scheduler_mode, outbound=outbound, seek_ms=seek_ms,
+            media_clock=media_clock, signals=self.signals, schedule=schedule,
+            rate_limiter=rate_limiter, chat_latency=chat_latency, compensate_chat=compensate_chat)
         self.lightplan_dict = lightplan_dict
-        self.events = self.lightplan_dict["events"].copy()
-        # Remember the original order
-        for x in range(0, len(self.events)):
-            self.events[x]["original_index"] = x
         self.stream_delay_ms = stream_delay
-        self.runtime_adjust_ms = adjust
-        self.running = False
-        self.lp_stopped = False
-        self.start_time = 0
-        self.elapsed_time = 0
-        self.start_ms = self.lightplan_dict["starting_ms"]
-        self.cur_index = starting_index
+        self.start_ms = self.player.start_ms
+        self.schedule = self.player.schedule
+        self.scheduler = self.player.scheduler
+        self.stats = self.player.stats
+        self.telemetry = self.player.telemetry
+
+    @property
+    def runtime_adjust_ms(self):
+        return self.player.runtime_adjust_ms
 
     def update_runtime_adjustment(self, adjust_ms):
-        self.runtime_adjust_ms = adjust_ms
+        self.player.update_runtime_adjustment(adjust_ms)
+
+    def seek(self, song_ms):
+        self.player.seek(song_ms)
 
     def stop(self):
-        self.lp_stopped = True
+        self.player.stop()
 
     def is_running(self):
-        return self.running
+        return self.player.is_running()
 
     def run(self):
-        num_events = len(self.events) 
+        self.player.run()
 
-        #If no events, dont even bother
-        if(num_events==0):
-            self.done("No Events To Process")
-            return
 
-        # Initialize some variables
-        start_time = time.time()
-        self.running = True
-        elapsed_time_ms = 0
-        current_event = None
-        played_event_count = 0
-        self.log("LightPlan Started")
-        
-        # Calculate the true offset factoring in "ignore_delay" and start_ms
-        for evt in self.events:
-            calculated_offset = evt["offset"]-self.start_ms
-            if(not evt["ignore_delay"]):
-                calculated_offset -= self.stream_delay_ms
-            evt["offset"] = calculated_offset
-
-        #Sort the events chronologically
-        self.events.sort(key = lambda i: i['offset'])
-
-        # Initialize the first event and send progress to the GUI Thread
-        current_event = self.events.pop(0)
-        self.progress(0, round(current_event["offset"]/1000,1), current_event["command"], -1)
-
-        # Begin LightPlanRunner Loop
-        while self.running == True:
-            # Check to see if LP has been stopped
-            if(self.lp_stopped):
-                self.done("LightPlan Stopped")
-                return
+class SinkLogSignals(QObject):
+    # Qt signals for the output sinks, which log from the runner and their
+    # own threads; the emits are queued to the GUI thread
+    log = Signal(str, LogLevel)
 
-            #Update the time elapsed since LPR started
-            elapsed_time_ms = int((time.time()-start_time)*1000)
-
-            #Check to see if any events need firing
-            if(elapsed_time_ms >= (current_event["offset"]+self.runtime_adjust_ms)):
-                #Calculate the error (number of ms off target)
-                error_str = ""
-                error = elapsed_time_ms - current_event['offset']
-                if(error<0):
-                    error_str = f" -{error}ms"
-                if(error>0):
-                    error_str = f" +{error}ms"
-
-                #Fire the event
-                self.fire(current_event['command'], error_str)
-
-                # Send the progress update to GUI Thread
-                fired_index = current_event['original_index']
-                played_event_count += 1
-                if(len(self.events)>0):
-                    current_event = self.events.pop(0)
-                    self.progress(played_event_count, round(current_event["offset"]/1000,1), current_event["command"], fired_index)
-                else:
-                    # No more events. Done
-                    self.done("LightPlan Complete")
-                    return
-            time.sleep(0.0001)
 
-    def fire(self, msg, error = ""):
-        self.signals.privmsg.emit(msg)
-        self.log(f"Fired: {msg}{error}")
+class LightPlanLoader(QRunnable):
+    # Parses and compiles a .plan file off the GUI thread
+
+    class Signals(QObject):
+        log = Signal(str, LogLevel)
+        done = Signal(str, object)
+
+    def __init__(self, path, stream_delay_ms=0, latencies=None, sinks=None):
+        super(LightPlanLoader, self).__init__()
+        self.signals = self.Signals()
+        self.path = path
+        self.stream_delay_ms = stream_delay_ms
+        self.latencies = latencies
+        self.sinks = sinks
+
+    def run(self):
+        try:
+            prepared = PreparedLightPlan.load(self.path, self.stream_delay_ms, self.latencies, self.sinks)
+        except (OSError, ValueError) as err:
+            self.log(f"Could not load LightPlan {self.path}", LogLevel.ERROR)
+            self.log(str(err), LogLevel.DEBUG)
+            prepared = None
+        self.signals.done.emit(self.path, prepared)
+
+    def log(self, msg, level=LogLevel.INFO):
+        self.signals.log.emit(msg, level)
+
+
+class LightPlanScanner(QRunnable):
+    # Reads the headers of every LightPlan in the LightPlan directory off the
+    # GUI thread, on its own connection to the plan_files index, and streams
+    # them back in batches so the explorer fills in while a large or slow
+    # directory is still being read
+
+    class Signals(QObject):
+        log = Signal(str, LogLevel)
+        batch = Signal(object)
+        done = Signal(object, object)
+
+    def __init__(self, db_path, root):
+        super(LightPlanScanner, self).__init__()
+        self.signals = self.Signals()
+        self.db_path = db_path
+        self.root = root
+        self.stopped = False
 
-    def progress(self, cur_evt_num, event_count, next_command, orig_index):
-        self.signals.progress.emit(cur_evt_num, event_count, next_command, orig_index)
+    def run(self):
+        # done gets the paths of all plans found, so the explorer can drop
+        # the ones that are gone, and the directories to watch. It is always
+        # emitted; paths is None if the scan failed or was stopped, and then
+        # nothing may be pruned.
+        paths = set()
+        dirs = []
+        db = None
+        try:
+            db = LightPlanDB(self.db_path)
+            db.signals.log.connect(self.log)
+            for batch in db.iter_plan_files(self.root, dirs, self.is_stopped):
+                paths.update(lp["path"] for lp in batch)
+                self.signals.batch.emit(batch)
+        except Exception as e:
+            self.log(f"Could not scan the LightPlan directory: {e}", LogLevel.ERROR)
+            paths = None
+        finally:
+            if(db is not None):
+                db.connection.close()
+            if(self.stopped):
+                paths = None
+            self.signals.done.emit(paths, dirs)
+
+    def is_stopped(self):
+        return self.stopped
 
-    def done(self, msg):
-        self.running = False
-        self.log(msg)
-        self.signals.done.emit(msg)
+    def stop(self):
+        self.stopped = True
 
     def log(self, msg, level=LogLevel.INFO):
         self.signals.log.emit(msg, level)
@@ -437,6 +765,138 @@ class LightPlanTreeModel(QStandardItemModel):
         print(f"Drop Event")
         print(data)
 
+class LightPlanTreeBuilder():
+    # Keeps the LightPlan Explorer model in step with the plan headers
+    # ({path, artist, title, ssl_id}) from LightPlanDB.scan_plan_files.
+    # Folder and artist items are found through dicts keyed by folder and
+    # (folder, artist), so applying n headers is linear in n. Plans directly
+    # in root have folder None.
+
+    # Looking up Qt enum members costs more than the rest of an insert, so
+    # they are resolved once here
+    DISPLAY_ROLE = Qt.DisplayRole
+    USER_ROLE = Qt.UserRole
+    RANKS = {"Directory": 0, "Artist": 1}
+
+    def __init__(self, model, root, dir_icon=None, lightplan_icon=None):
+        self.model = model
+        self.root = root
+        self.dir_icon = dir_icon
+        self.lightplan_icon = lightplan_icon
+        self.items = {}
+        self.folders = {}
+        self.artists = {}
+
+    def headers(self):
+        return [lp for lp, item, folder in self.items.values()]
+
+    def folder(self, path):
+        dir_path = os.path.dirname(path)
+        if(dir_path and dir_path != self.root):
+            return os.path.basename(dir_path)
+        return None
+
+    def apply(self, headers):
+        # Applies the difference between the headers already in the model
+        # and these
+        self.update(headers)
+        self.prune(set(lp["path"] for lp in headers))
+
+    def update(self, headers):
+        # Adds or changes the items for these headers. Items for unchanged
+        # files are left alone, so expansion and selection survive.
+        for lp in headers:
+            entry = self.items.get(lp["path"])
+            if(entry is None):
+                self.add(lp)
+                continue
+            old, item, folder = entry
+            if(lp == old):
+                continue
+            if(lp["artist"] != old["artist"]):
+                self.remove(lp["path"])
+                self.add(lp)
+                continue
+            # Same artist item (the folder is part of the path), so only the
+            # title and its place among the songs can change
+            artist_item = item.parent()
+            artist_item.takeRow(item.row())
+            item.setData(lp["title"], self.DISPLAY_ROLE)
+            self.insert(artist_item, item)
+            self.items[lp["path"]] = (lp, item, folder)
+
+    def prune(self, paths):
+        # Removes the items of all plans not in paths
+        for path in [path for path in self.items if path not in paths]:
+            self.remove(path)
+
+    def add(self, lp):
+        folder = self.folder(lp["path"])
+        artist_item = self.artists.get((folder, lp["artist"]))
+        if(artist_item is None):
+            parent = self.model.invisibleRootItem()
+            if(folder is not None):
+                parent = self.folders.get(folder)
+                if(parent is None):
+                    parent = self.create_item(folder, "Directory", self.dir_icon)
+                    self.insert(self.model.invisibleRootItem(), parent)
+                    self.folders[folder] = parent
+            artist_item = self.create_item(lp["artist"], "Artist")
+            self.insert(parent, artist_item)
+            self.artists[(folder, lp["artist"])] = artist_item
+        item = self.create_item(lp["title"], lp["path"], self.lightplan_icon)
+        self.insert(artist_item, item)
+        self.items[lp["path"]] = (lp, item, folder)
+
+    def remove(self, path):
+        # Removes the plan's item and any Artist or Directory item it leaves empty
+        lp, item, folder = self.items.pop(path)
+        artist_item = self.artists[(folder, lp["artist"])]
+        artist_item.removeRow(item.row())
+        if(artist_item.rowCount() > 0):
+            return
+        del self.artists[(folder, lp["artist"])]
+        if(folder is None):
+            self.model.removeRow(artist_item.row())
+            return
+        parent = self.folders[folder]
+        parent.removeRow(artist_item.row())
+        if(parent.rowCount() == 0):
+            del self.folders[folder]
+            self.model.removeRow(parent.row())
+
+    def create_item(self, text, data, icon=None):
+        # data (Qt.UserRole) is "Directory", "Artist" or the path of a plan
+        item = QStandardItem(text)
+        item.setEditable(False)
+        item.setData(data, self.USER_ROLE)
+        if(icon is not None):
+            item.setIcon(icon)
+        return item
+
+    def sort_key(self, item):
+        # Directories, then artists, then songs, each alphabetically
+        return (self.RANKS.get(item.data(self.USER_ROLE), 2), str(item.data(self.DISPLAY_ROLE)).casefold())
+
+    def insert(self, parent, item):
+        # Children are kept sorted. Headers arrive sorted by path, so most
+        # items go at the end; otherwise binary search for the row.
+        key = self.sort_key(item)
+        rows = parent.rowCount()
+        if(rows == 0 or self.sort_key(parent.child(rows - 1)) <= key):
+            parent.appendRow(item)
+            return
+        low = 0
+        high = rows
+        while low < high:
+            mid = (low + high) // 2
+            if(self.sort_key(parent.child(mid)) <= key):
+                low = mid + 1
+            else:
+                high = mid
+        parent.insertRow(low, [item])
+
+
 class KeyListener(QRunnable):
 
     class Signals(QObject):
@@ -483,76 +943,52 @@ class TwitchIRC(QRunnable):
         irc_disconnect = Signal()
         irc_connect = Signal()
         connect_failed = Signal()
+        reconnecting = Signal(float)
 
-    def __init__(self, nickname, token, channel, server="irc.chat.twitch.tv", port=6667):
+    def __init__(self, nickname, token, channel, server="irc.chat.twitch.tv", port=6667, use_tls=False, stale_ms=2000,
+            accounts=None, pool_mode=PoolMode.CHANNEL, rate_limit=20, rate_window_ms=30000, probe=False):
         super(TwitchIRC, self).__init__()
-        self._connect_failed = True
-        self.stop = False
         self.signals = self.Signals()
-        self.connection = False
-        self.server = server
-        self.port = port
-        self.nickname = nickname
-        self.token = "oauth:"+token
-        if(len(channel) > 0 and channel[0] != "#"):
-            channel = "#"+channel
-        self.channel = channel
-        self.reactor = irc.client.Reactor()
+        # The connection itself lives in the Qt-free TwitchChat, or a
+        # TwitchPool when extra (nickname, token, channel) accounts are given
+        if(accounts):
+            self.chat = TwitchPool([(nickname, token, channel)] + list(accounts), server, port, signals=self.signals, use_tls=use_tls,
+                stale_ms=stale_ms, mode=pool_mode, rate_limit=rate_limit, rate_window_ms=rate_window_ms, probe=probe)
+        else:
+            self.chat = TwitchChat(nickname, token, channel, server, port, signals=self.signals, use_tls=use_tls, stale_ms=stale_ms, probe=probe)
+        self.chat_latency = self.chat.chat_latency
+        self.channel = self.chat.channel
+        self.outbound = self.chat.outbound
         
     def connected(self):
-        if(self.connection):
-            return self.connection.is_connected()
-        return False
-        
-    def on_connect(self, connection, event):
-        self.log("Connected to irc.chat.twitch.tv")
-        self._connect_failed = False
-        connection.join(self.channel)
-        self.signals.irc_connect.emit()
-
-    def on_join(self, connection, event):
-        self.log(f"Joined channel {self.channel}")
-
-    def on_disconnect(self, connection, event):
-        if(self._connect_failed):
-            self.log("irc.chat.twitch.tv connection failed", LogLevel.ERROR)
-            self.signals.connect_failed.emit()
-        else:
-            self.log("Disconnected from irc.chat.twitch.tv")
-            self.signals.irc_disconnect.emit()
-        self.stop = True
+        return self.chat.connected()
         
-    def privmsg(self, text):
-        if(self.connected()):
-            self.log(f"Sent: {text}", LogLevel.DEBUG)
-            self.connection.privmsg(self.channel, text)
+    def reconnecting(self):
+        return self.chat.reconnecting()
+
+    def privmsg(self, text, index=-1, telemetry=None):
+        return self.chat.privmsg(text, index, telemetry)
+
+    def prewarm(self):
+        self.chat.prewarm()
+
+    def rate_multiplier(self):
+        return self.chat.rate_multiplier()
+
+    def summary_lines(self):
+        return self.chat.summary_lines()
+
+    def prepare(self, schedule):
+        self.chat.prepare(schedule)
     
     def disconnect(self):
-        self.reactor.disconnect_all()
+        self.chat.disconnect()
     
     def run(self):
-        try:
-            self.connect()
-        except irc.client.ServerConnectionError as err:
-            self.log(repr(err), LogLevel.ERROR)
-
-        while not self.stop:
-            self.reactor.process_once()
-            time.sleep(0.001)
-        self.disconnect()
+        self.chat.run()
 
     def die(self):
-        self.stop = True
-
-    def connect(self):
-        try:
-            self.connection = self.reactor.server().connect(self.server, self.port, self.nickname, self.token)
-        except irc.client.ServerConnectionError as err:
-            self.log(repr(err), LogLevel.ERROR)
-            raise
-        self.connection.add_global_handler("welcome", self.on_connect)
-        self.connection.add_global_handler("join", self.on_join)
-        self.connection.add_global_handler("disconnect", self.on_disconnect)
+        self.chat.die()
 
     def log(self, msg, level=LogLevel.INFO):
         self.signals.log.emit(msg, level)
@@ -626,12 +1062,15 @@ class YoutubeDownloader(QRunnable):
 
 class LightPlanEvent():
     
-    def __init__(self, offset_ms=0, command="", comment="", ignore_delay=False):
+    def __init__(self, offset_ms=0, command="", comment="", ignore_delay=False, sink=None, profile=None):
         self.commands = commands
         self.offset_ms = offset_ms
         self.command = command
         self.comment = comment
         self.ignore_delay = ignore_delay
+        # Output sink and latency profile names, None uses the plan's
+        self.sink = sink
+        self.profile = profile
         
     def __lt__(self, other):
         return self.offset_ms < other.offset_ms
@@ -908,6 +1347,10 @@ class LightPlanTableModel(QAbstractTableModel):
                 "comment": evt.comment,
                 "ignore_delay": evt.ignore_delay
             }
+            if(evt.sink):
+                obj["sink"] = evt.sink
+            if(evt.profile):
+                obj["profile"] = evt.profile
             evt_list.append(obj)
         return evt_list
     
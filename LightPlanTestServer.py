@@ -0,0 +1,415 @@
+# Python Imports
+import sys
+import csv
+import time
+import heapq
+import random
+import socket
+import argparse
+import datetime
+import threading
+import selectors
+
+# LightPlanStudio Imports
+from LightPlanCore import LogLevel, Callback, SchedulerMode, RateLimiter, TimingTelemetry, CompiledSchedule, LightPlanPlayer
+from LightPlanIRC import IRCMessage, TwitchChat
+
+# A local stand-in for Twitch chat speaking the subset TwitchChat uses: CAP,
+# PASS/NICK, welcome, PING, JOIN and PRIVMSG with the echo (tagged with
+# tmi-sent-ts) going to every other client in the channel. Artificial uplink
+# and downlink latency, jitter and a per connection rate limit make it
+# possible to test the scheduler and transport on any machine without a
+# Twitch account. Run it on its own with --serve, or without to push a
+# synthetic LightPlan through it and report when each cue hit the wire.
+
+class ServerSignals():
+
+    def __init__(self):
+        self.log = Callback()
+
+
+class TestClient():
+
+    def __init__(self, sock, address, limiter):
+        self.sock = sock
+        self.address = address
+        self.limiter = limiter
+        self.nickname = None
+        self.password = None
+        self.registered = False
+        self.tags = False
+        self.channels = set()
+        self.recv_buffer = b""
+        self.send_buffer = bytearray()
+
+    def prefix(self):
+        return f"{self.nickname}!{self.nickname}@{self.nickname}.tmi.twitch.tv"
+
+
+class TwitchTestServer():
+
+    HOST = "tmi.twitch.tv"
+
+    def __init__(self, host="127.0.0.1", port=0, uplink_ms=0, downlink_ms=0, jitter_ms=0, rate_limit=20, rate_window_ms=30000, signals=None):
+        self.signals = signals if signals is not None else ServerSignals()
+        self.host = host
+        self.port = port
+        self.uplink_ms = uplink_ms
+        self.downlink_ms = downlink_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.rate_window_ms = rate_window_ms
+        self.stop = False
+        self.clients = {}
+        # (perf_counter, nickname, channel, text, accepted) for every PRIVMSG,
+        # stamped the moment the line is read off the socket
+        self.arrivals = []
+        self.rate_limited = 0
+        self._pending = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.selector = selectors.DefaultSelector()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.host, self.port))
+        self.port = self.listener.getsockname()[1]
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="TwitchTestServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        self.stop = True
+        self.call_soon(lambda: None)
+        if(self._thread is not None):
+            self._thread.join()
+
+    def call_soon(self, callback, delay_ms=0):
+        # Thread safe; callbacks run on the server thread
+        with self._lock:
+            self._sequence += 1
+            heapq.heappush(self._pending, (time.perf_counter() + delay_ms/1000, self._sequence, callback))
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    def jitter(self):
+        if(self.jitter_ms <= 0):
+            return 0
+        return random.uniform(0, self.jitter_ms)
+
+    def reconnect_all(self):
+        # Same as Twitch going down for maintenance
+        self.call_soon(self._reconnect_all)
+
+    def drop_all(self):
+        # Hang up on everyone without warning, for testing reconnects
+        self.call_soon(self._drop_all)
+
+    def _reconnect_all(self):
+        for client in list(self.clients.values()):
+            self.send(client, f":{self.HOST} RECONNECT")
+
+    def _drop_all(self):
+        for client in list(self.clients.values()):
+            self.close(client)
+
+    def run(self):
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.selector.register(self._wake_r, selectors.EVENT_READ)
+        self.log(f"Test server listening on {self.host}:{self.port}")
+        while not self.stop:
+            timeout = None
+            with self._lock:
+                if(len(self._pending) > 0):
+                    timeout = max(self._pending[0][0] - time.perf_counter(), 0)
+            for key, events in self.selector.select(timeout):
+                if(key.fileobj is self.listener):
+                    self.accept()
+                elif(key.fileobj is self._wake_r):
+                    try:
+                        self._wake_r.recv(4096)
+                    except BlockingIOError:
+                        pass
+                else:
+                    client = key.data
+                    if(events & selectors.EVENT_WRITE):
+                        self.flush(client)
+                    if(events & selectors.EVENT_READ and client.sock.fileno() in self.clients):
+                        self.receive(client)
+            self.run_pending()
+        for client in list(self.clients.values()):
+            self.close(client)
+        self.selector.close()
+        self.listener.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def run_pending(self):
+        now = time.perf_counter()
+        while True:
+            with self._lock:
+                if(len(self._pending) == 0 or self._pending[0][0] > now):
+                    return
+                due, sequence, callback = heapq.heappop(self._pending)
+            callback()
+
+    def accept(self):
+        sock, address = self.listener.accept()
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = TestClient(sock, address, RateLimiter(self.rate_limit, self.rate_window_ms) if self.rate_limit > 0 else None)
+        self.clients[sock.fileno()] = client
+        self.selector.register(sock, selectors.EVENT_READ, client)
+
+    def close(self, client):
+        fileno = client.sock.fileno()
+        if(fileno not in self.clients):
+            return
+        del self.clients[fileno]
+        self.selector.unregister(client.sock)
+        client.sock.close()
+
+    def receive(self, client):
+        try:
+            data = client.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        received = time.perf_counter()
+        if(not data):
+            self.close(client)
+            return
+        lines = (client.recv_buffer + data).split(b"\r\n")
+        client.recv_buffer = lines.pop()
+        for line in lines:
+            message = IRCMessage.parse(line.decode("utf-8", errors="replace"))
+            if(message is not None):
+                self.on_message(client, message, received)
+
+    def on_message(self, client, message, received):
+        if(message.command == "CAP"):
+            caps = message.params[-1] if message.params else ""
+            client.tags = "twitch.tv/tags" in caps
+            self.send(client, f":{self.HOST} CAP * ACK :{caps}")
+        elif(message.command == "PASS"):
+            client.password = message.params[0] if message.params else ""
+        elif(message.command == "NICK"):
+            client.nickname = message.params[0].lower() if message.params else ""
+            anonymous = client.nickname.startswith("justinfan")
+            if(not anonymous and (not client.password or client.password == "oauth:bad")):
+                self.send(client, f":{self.HOST} NOTICE * :Login authentication failed")
+                self.close(client)
+                return
+            client.registered = True
+            self.send(client, f":{self.HOST} 001 {client.nickname} :Welcome, GLHF!")
+        elif(message.command == "PING"):
+            self.send(client, f":{self.HOST} PONG {self.HOST} :" + (message.params[-1] if message.params else self.HOST))
+        elif(message.command == "JOIN" and client.registered):
+            for channel in message.params[0].lower().split(","):
+                client.channels.add(channel)
+                self.send(client, f":{client.prefix()} JOIN {channel}")
+        elif(message.command == "PART"):
+            for channel in message.params[0].lower().split(","):
+                client.channels.discard(channel)
+        elif(message.command == "PRIVMSG" and client.registered and len(message.params) >= 2):
+            channel = message.params[0].lower()
+            text = message.params[-1]
+            accepted = True
+            if(client.limiter is not None):
+                now_ms = received * 1000
+                if(client.limiter.available_at(now_ms) > now_ms):
+                    accepted = False
+                else:
+                    client.limiter.take(now_ms)
+            self.arrivals.append((received, client.nickname, channel, text, accepted))
+            if(not accepted):
+                self.rate_limited += 1
+                self.send(client, f"@msg-id=msg_ratelimit :{self.HOST} NOTICE {channel} :Your message was not sent because you are sending messages too quickly.")
+                return
+            self.call_soon(lambda: self.relay(client, channel, text), self.uplink_ms + self.jitter())
+        elif(message.command == "QUIT"):
+            self.close(client)
+
+    def relay(self, sender, channel, text):
+        # The message "reaches Twitch" now, viewers see it after the downlink
+        sent_ts = int(time.time() * 1000)
+        for client in list(self.clients.values()):
+            if(client is sender or channel not in client.channels):
+                continue
+            line = f":{sender.prefix()} PRIVMSG {channel} :{text}"
+            if(client.tags):
+                line = f"@display-name={sender.nickname};tmi-sent-ts={sent_ts} " + line
+            self.call_soon(lambda client=client, line=line: self.send(client, line), self.downlink_ms + self.jitter())
+
+    def send(self, client, line):
+        if(client.sock.fileno() not in self.clients):
+            return
+        client.send_buffer += (line + "\r\n").encode("utf-8")
+        self.flush(client)
+
+    def flush(self, client):
+        try:
+            sent = client.sock.send(client.send_buffer)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self.close(client)
+            return
+        del client.send_buffer[:sent]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if len(client.send_buffer) > 0 else 0)
+        self.selector.modify(client.sock, events, client)
+
+    def log(self, msg, level=LogLevel.INFO):
+        self.signals.log.emit(msg, level)
+
+
+class Benchmark():
+    # Runs a synthetic LightPlan through LightPlanPlayer (the Qt-free core of
+    # LightPlanRunner) and TwitchChat against a TwitchTestServer, and reports
+    # the wire arrival error of every cue: when its PRIVMSG reached the
+    # server relative to when it was scheduled. Server and player share
+    # time.perf_counter, so no clock sync is involved.
+
+    def __init__(self, args):
+        self.args = args
+        self.log_level = LogLevel.DEBUG if args.verbose else LogLevel.INFO
+
+    def log(self, msg, level=LogLevel.INFO):
+        if(not msg or level.value > self.log_level.value):
+            return
+        print(msg, flush=True)
+
+    def player_log(self, msg, level=LogLevel.INFO):
+        # Per cue chatter only with -v, the summary is printed by report()
+        self.log(msg, LogLevel.DEBUG if level == LogLevel.INFO else level)
+
+    def synthetic_plan(self):
+        # Unique commands so each arrival maps back to exactly one cue
+        events = []
+        for x in range(self.args.events):
+            events.append({"offset": self.args.lead_in + x * self.args.interval, "command": f"!cue{x:05d}", "ignore_delay": False})
+        return {"song_artist": "Benchmark", "song_title": f"{self.args.events} cues every {self.args.interval}ms", "starting_ms": 0, "events": events}
+
+    def run(self):
+        server = TwitchTestServer(uplink_ms=self.args.uplink, downlink_ms=self.args.downlink, jitter_ms=self.args.jitter,
+            rate_limit=self.args.rate_limit, rate_window_ms=self.args.rate_window * 1000)
+        server.signals.log.connect(self.log)
+        server.start()
+
+        connected = threading.Event()
+        chat = TwitchChat("benchbot", "benchmark", "benchmark", "127.0.0.1", server.port, probe=self.args.probe)
+        chat.signals.log.connect(self.log)
+        chat.signals.irc_connect.connect(connected.set)
+        thread = threading.Thread(target=chat.run, name="TwitchChat", daemon=True)
+        thread.start()
+        if(not connected.wait(5)):
+            self.log("Could not connect to the test server", LogLevel.ERROR)
+            server.shutdown()
+            return 1
+
+        plan = self.synthetic_plan()
+        schedule = CompiledSchedule.compile(plan)
+        chat.prepare(schedule)
+        player = LightPlanPlayer(plan, scheduler_mode=SchedulerMode.get(self.args.scheduler), outbound=chat.outbound,
+            schedule=schedule, chat_latency=chat.chat_latency if self.args.probe else None)
+        player.signals.log.connect(self.player_log)
+        player.run()
+
+        # Wait for the last cues to reach the server
+        deadline = time.perf_counter() + 1 + self.args.uplink/1000
+        while len(server.arrivals) < len(schedule) and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        time.sleep(self.args.downlink/1000 + 0.05)
+        chat.die()
+        thread.join(2)
+        server.shutdown()
+
+        rows = self.results(player, server.arrivals)
+        self.report(player, chat, server, rows)
+        if(self.args.csv):
+            with open(self.args.csv, "w", newline="") as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=list(rows[0].keys()) if rows else ["index"])
+                writer.writeheader()
+                writer.writerows(rows)
+            self.log(f"Per cue results: {self.args.csv}")
+        return 0
+
+    def results(self, player, arrivals):
+        arrived = {}
+        for received, nickname, channel, text, accepted in arrivals:
+            arrived.setdefault(text, (received, accepted))
+        rows = []
+        for sample in player.telemetry.samples():
+            received, accepted = arrived.get(sample["command"], (None, False))
+            arrival_ms = None if received is None else (received - player.start_time) * 1000
+            rows.append({
+                "index": sample["index"],
+                "command": sample["command"],
+                "scheduled_ms": sample["scheduled_ms"],
+                "wake_ms": sample["wake_ms"],
+                "sent_ms": sample["sent_ms"],
+                "arrival_ms": arrival_ms,
+                "arrival_error_ms": None if arrival_ms is None else arrival_ms - sample["scheduled_ms"],
+                "rate_limited": received is not None and not accepted
+            })
+        return rows
+
+    def report(self, player, chat, server, rows):
+        errors = [row["arrival_error_ms"] for row in rows if row["arrival_error_ms"] is not None]
+        self.log(f"Scheduler: {type(player.scheduler).__name__}, {len(rows)} cues fired, {len(errors)} arrived, {server.rate_limited} rate limited")
+        self.log(player.stats.summary())
+        if(len(errors) > 0):
+            err = TimingTelemetry.describe(errors)
+            self.log(f"Wire arrival error p50 {err['p50']:+.3f}ms p90 {err['p90']:+.3f}ms p99 {err['p99']:+.3f}ms max {err['max']:+.3f}ms")
+        for line in chat.summary_lines():
+            self.log(line)
+        if(self.args.verbose):
+            for row in rows:
+                error = "lost" if row["arrival_error_ms"] is None else f"{row['arrival_error_ms']:+.3f}ms"
+                self.log(f"{row['index']:5d} {row['command']} {error}{' (rate limited)' if row['rate_limited'] else ''}", LogLevel.DEBUG)
+
+
+def serve(args):
+    server = TwitchTestServer(args.host, args.port, args.uplink, args.downlink, args.jitter, args.rate_limit, args.rate_window * 1000)
+    server.signals.log.connect(lambda msg, level=LogLevel.INFO: print(f"{datetime.datetime.now().strftime('%H:%M:%S')} - {msg}", flush=True))
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local Twitch chat stand-in and transport benchmark")
+    parser.add_argument("--serve", action="store_true", help="Only run the server (point LightPlanCLI --server/--port at it)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6667)
+    parser.add_argument("--uplink", type=float, default=0, help="Artificial latency in ms before a message reaches the 'server'")
+    parser.add_argument("--downlink", type=float, default=0, help="Artificial latency in ms before other clients see it")
+    parser.add_argument("--jitter", type=float, default=0, help="Up to this many ms added to each latency")
+    parser.add_argument("--rate-limit", type=int, default=20, help="Messages per rate window per connection (0 for no limit)")
+    parser.add_argument("--rate-window", type=float, default=30, help="Rate window in seconds")
+    parser.add_argument("--events", type=int, default=200, help="Benchmark: number of cues")
+    parser.add_argument("--interval", type=int, default=50, help="Benchmark: ms between cues")
+    parser.add_argument("--lead-in", type=int, default=500, help="Benchmark: ms before the first cue")
+    parser.add_argument("--scheduler", default=SchedulerMode.DEADLINE.name.lower(), choices=[mode.name.lower() for mode in SchedulerMode])
+    parser.add_argument("--probe", action="store_true", help="Benchmark: also run the chat latency probe")
+    parser.add_argument("--csv", help="Benchmark: write per cue results to this file")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if(args.serve):
+        sys.exit(serve(args))
+    sys.exit(Benchmark(args).run())
@@ -0,0 +1,74 @@
+# Python Imports
+import sys
+import time
+import random
+import argparse
+
+# PySide6 Imports
+from PySide6.QtWidgets import QApplication, QTreeView
+
+# LightPlanStudio Imports
+from LightPlanStudioLib import LightPlanTreeModel, LightPlanTreeBuilder
+
+# Times the LightPlan Explorer tree builder on synthetic libraries: the
+# first build, a rescan where nothing changed and a rescan with one file
+# added, one removed and one retitled. No files are written; the headers are
+# what LightPlanDB.scan_plan_files would return for such a library.
+
+ROOT = "/LightPlans"
+
+def synthetic_headers(count, folders, seed=0):
+    # About 8 songs per artist, a quarter of the plans in folders
+    rand = random.Random(seed)
+    artists = max(1, count // 8)
+    headers = []
+    for x in range(count):
+        artist = f"Artist {rand.randrange(artists):05d}"
+        title = f"Song {x:06d}"
+        folder = f"Folder {rand.randrange(folders):02d}/" if folders > 0 and rand.random() < 0.25 else ""
+        headers.append({"path": f"{ROOT}/{folder}{artist} - {title}.plan", "artist": artist, "title": title, "ssl_id": 0})
+    headers.sort(key=lambda lp: lp["path"].casefold().split("/"))
+    return headers
+
+def time_ms(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+def run(count, args):
+    headers = synthetic_headers(count, args.folders)
+    model = LightPlanTreeModel()
+    model.setHorizontalHeaderLabels(['LightPlans'])
+    view = None
+    if(args.view):
+        # An attached view gets a rowsInserted signal for every item
+        view = QTreeView()
+        view.setModel(model)
+    builder = LightPlanTreeBuilder(model, ROOT)
+    build = time_ms(builder.apply, headers)
+    unchanged = time_ms(builder.apply, headers)
+
+    changed = list(headers)
+    changed.pop(len(changed) // 2)
+    changed[len(changed) // 3] = dict(changed[len(changed) // 3], title="Retitled")
+    changed.append({"path": f"{ROOT}/Artist New - Song New.plan", "artist": "Artist New", "title": "Song New", "ssl_id": 0})
+    incremental = time_ms(builder.apply, changed)
+
+    items = len(builder.items) + len(builder.artists) + len(builder.folders)
+    print(f"{count:7d} plans {items:7d} items  build {build:9.1f}ms  unchanged {unchanged:7.1f}ms  "
+        f"3 changes {incremental:7.1f}ms  ({build * 1000 / count:.1f}us/plan)", flush=True)
+    if(view is not None):
+        view.deleteLater()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="LightPlan Explorer tree build benchmark")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="Comma separated library sizes")
+    parser.add_argument("--folders", type=int, default=20, help="Number of sub folders in the synthetic library")
+    parser.add_argument("--view", action="store_true", help="Attach a QTreeView to the model while building")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    app = QApplication(sys.argv)
+    for size in args.sizes.split(","):
+        run(int(size), args)
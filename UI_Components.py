@@ -141,11 +141,11 @@ from PySide6.QtGui import (QAction, QBrush, QColor, QConicalGradient,
     QTransform)
 from PySide6.QtWidgets import (QAbstractItemView, QApplication, QDoubleSpinBox, QFrame,
     QGroupBox, QHeaderView, QLCDNumber, QLabel,
-    QLineEdit, QMainWindow, QMenu, QMenuBar,
-    QPlainTextEdit, QProgressBar, QPushButton, QSizePolicy,
-    QSlider, QSpacerItem, QStatusBar, QTabWidget,
-    QTableView, QTextEdit, QTreeView, QVBoxLayout,
-    QWidget)
+    QLineEdit, QListWidget, QListWidgetItem, QMainWindow,
+    QMenu, QMenuBar, QPlainTextEdit, QProgressBar,
+    QPushButton, QSizePolicy, QSlider, QSpacerItem,
+    QStatusBar, QTabWidget, QTableView, QTextEdit,
+    QTreeView, QVBoxLayout, QWidget)
 
 class Ui_LPS_MainWindow(object):
     def setupUi(self, LPS_MainWindow):
@@ -192,13 +192,21 @@ class Ui_LPS_MainWindow(object):
         self.tabWidget.setGeometry(QRect(560, 10, 231, 341))
         self.lightPlanTab = QWidget()
         self.lightPlanTab.setObjectName(u"lightPlanTab")
+        self.lp_search_edit = QLineEdit(self.lightPlanTab)
+        self.lp_search_edit.setObjectName(u"lp_search_edit")
+        self.lp_search_edit.setGeometry(QRect(10, 10, 201, 22))
+        self.lp_search_edit.setClearButtonEnabled(True)
         self.lp_tree_view = QTreeView(self.lightPlanTab)
         self.lp_tree_view.setObjectName(u"lp_tree_view")
-        self.lp_tree_view.setGeometry(QRect(10, 10, 201, 291))
+        self.lp_tree_view.setGeometry(QRect(10, 36, 201, 265))
         self.lp_tree_view.setAcceptDrops(True)
         self.lp_tree_view.setDragDropMode(QAbstractItemView.DropOnly)
         self.lp_tree_view.setDefaultDropAction(Qt.CopyAction)
         self.lp_tree_view.setAlternatingRowColors(True)
+        self.lp_search_results = QListWidget(self.lightPlanTab)
+        self.lp_search_results.setObjectName(u"lp_search_results")
+        self.lp_search_results.setGeometry(QRect(10, 36, 201, 265))
+        self.lp_search_results.setAlternatingRowColors(True)
         self.tabWidget.addTab(self.lightPlanTab, "")
         self.sslTab = QWidget()
         self.sslTab.setObjectName(u"sslTab")
@@ -506,6 +514,7 @@ class Ui_LPS_MainWindow(object):
         self.action_open_configdir.setText(QCoreApplication.translate("LPS_MainWindow", u"Open Config Directory", None))
         self.action_import_lp.setText(QCoreApplication.translate("LPS_MainWindow", u"Import LightPlan", None))
         self.action_export_lp.setText(QCoreApplication.translate("LPS_MainWindow", u"Export LightPlan", None))
+        self.lp_search_edit.setPlaceholderText(QCoreApplication.translate("LPS_MainWindow", u"Search LightPlans", None))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.lightPlanTab), QCoreApplication.translate("LPS_MainWindow", u"LightPlan Explorer", None))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.sslTab), QCoreApplication.translate("LPS_MainWindow", u"SSL Queue", None))
         self.LightPlanBox.setTitle(QCoreApplication.translate("LPS_MainWindow", u"LightPlan", None))
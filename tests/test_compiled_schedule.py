@@ -0,0 +1,48 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from LightPlanCore import CompiledSchedule, PreparedLightPlan
+
+
+def sink_plan():
+    # The plan sends to dmx, every other event overrides it
+    events = [{"offset": 0, "command": "a", "sink": "chat"},
+        {"offset": 10, "command": "b", "sink": "lumia"},
+        {"offset": 20, "command": "c"}]
+    return {"song_artist": "Artist", "song_title": "Title", "starting_ms": 0, "sink": "dmx", "events": events}
+
+
+class CompiledScheduleSinkTest(unittest.TestCase):
+
+    def uses_chat(self, schedule):
+        return [schedule.uses_chat(index) for index in range(len(schedule))]
+
+    def test_unresolved(self):
+        schedule = CompiledSchedule.compile(sink_plan())
+        self.assertEqual(self.uses_chat(schedule), [True, False, False])
+        self.assertEqual(schedule.unknown_sinks, ())
+
+    def test_unconfigured_sinks_go_to_chat(self):
+        schedule = CompiledSchedule.compile(sink_plan(), sinks={"dmx"})
+        self.assertEqual(self.uses_chat(schedule), [True, True, False])
+        self.assertEqual(schedule.unknown_sinks, ("lumia",))
+        self.assertEqual(schedule.next_chat_index(0), 1)
+        self.assertEqual(schedule.next_chat_index(1), -1)
+
+    def test_no_sinks_configured(self):
+        schedule = CompiledSchedule.compile(sink_plan(), sinks={})
+        self.assertEqual(self.uses_chat(schedule), [True, True, True])
+        self.assertEqual(schedule.unknown_sinks, ("lumia", "dmx"))
+
+    def test_prepared_recompiles_for_new_sinks(self):
+        prepared = PreparedLightPlan("plan", sink_plan(), sinks=["dmx", "lumia"])
+        schedule = prepared.schedule
+        self.assertIs(prepared.schedule_for(0, None, {"lumia", "dmx"}), schedule)
+        self.assertEqual(self.uses_chat(prepared.schedule_for(0, None, {})), [True, True, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from LightPlanCore import CompiledSchedule, RateLimiter, RatePolicy
+from LightPlanIRC import PoolMode, pool_rate_multiplier
+from LightPlanCLI import LightPlanCLI, parse_args
+
+
+class PoolRateLimitTest(unittest.TestCase):
+
+    def test_multiplier(self):
+        self.assertEqual(pool_rate_multiplier([], PoolMode.ROUND_ROBIN), 1)
+        self.assertEqual(pool_rate_multiplier(["a", "a", "b"], PoolMode.ROUND_ROBIN), 3)
+        self.assertEqual(pool_rate_multiplier(["a", "A", "b", "b"], PoolMode.CHANNEL), 2)
+        self.assertEqual(pool_rate_multiplier(["a", "a", "b"], "channel"), 1)
+
+    def test_cli_round_robin_check(self):
+        # 40 cues in 30s is over one account's 20, within three accounts' 60
+        args = parse_args(["plan", "--ini", "", "--channel", "main", "--pool-mode", "round-robin",
+            "--account", "bot1:token@main", "--account", "bot2:token@main"])
+        cli = LightPlanCLI(args)
+        self.assertEqual(cli.rate_limit_connections(), 3)
+        events = [{"offset": x * 500, "command": f"cue {x}"} for x in range(40)]
+        schedule = CompiledSchedule.compile({"starting_ms": 0, "events": events})
+        single = RateLimiter(args.rate_limit, args.rate_window * 1000, RatePolicy.DROP)
+        pooled = RateLimiter(args.rate_limit * cli.rate_limit_connections(), args.rate_window * 1000, RatePolicy.DROP)
+        self.assertFalse(single.check(schedule).ok())
+        self.assertTrue(pooled.check(schedule).ok())
+
+    def test_cli_single_account(self):
+        cli = LightPlanCLI(parse_args(["plan", "--ini", "", "--channel", "main"]))
+        self.assertEqual(cli.rate_limit_connections(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()